@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Tabla de actividades precalculada a partir de las transacciones.
+
+Una actividad IATI (``iatiidentifier``) tiene varias transacciones. La
+tabla guarda una fila por actividad y combinación de atributos (fuente,
+país, macrosector) con sus fechas primera y última, la cantidad de
+transacciones y el monto total, más una matriz actividades x años con los
+años en los que la actividad tiene transacciones. Los conteos de
+actividades distintas de cualquier filtro se calculan sobre esta tabla, que
+es mucho más chica que la de transacciones.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+class ActivityTable:
+    """Actividades de ``df`` por ``attributes``, con sus años de actividad.
+
+    Una actividad con transacciones en varios macrosectores aparece una vez
+    por macrosector, de modo que cuenta en cada uno de ellos.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        attributes: list[str],
+        id_column: str = "iatiidentifier",
+        value: str = "value_usd",
+        date: str = "transactiondate_isodate",
+        year: str = "year",
+    ):
+        df = df[df[id_column].notna() & df[year].notna()]
+        self.id_column = id_column
+        keys = [id_column, *attributes]
+        grouped = df.groupby(keys, observed=True, dropna=False, sort=True)
+        self.table = grouped.agg(
+            first_date=(date, "min"),
+            last_date=(date, "max"),
+            transactions=(value, "count"),
+            value_usd=(value, "sum"),
+        ).reset_index()
+        group_ids = grouped.ngroup().to_numpy()
+        years = df[year].to_numpy(dtype=np.int64)
+        self.first_year = int(years.min()) if len(years) else 0
+        n_years = int(years.max()) - self.first_year + 1 if len(years) else 0
+        self._years = np.zeros((len(self.table), n_years), dtype=bool)
+        self._years[group_ids, years - self.first_year] = True
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def active(self, low: int, high: int) -> np.ndarray:
+        """Máscara de las filas con alguna transacción en ``low <= year <= high``."""
+        start = max(int(low) - self.first_year, 0)
+        stop = max(int(high) - self.first_year + 1, start)
+        return self._years[:, start:stop].any(axis=1)
+
+    def count(self, rows: pd.DataFrame, by: list[str], name: str) -> pd.DataFrame:
+        """Actividades distintas de ``rows`` (filas de ``table``) por ``by``."""
+        counts = rows.groupby(list(by), observed=True)[self.id_column].nunique()
+        return counts.rename(name).reset_index()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Cubo de agregados precalculados.
+
+Un cubo guarda, para cada combinación de claves (por ejemplo año, fuente,
+país y macrosector), la suma, la cantidad de filas, la suma de cuadrados y
+el mínimo y máximo de una columna de montos. Son medidas combinables: el
+total, el promedio, la varianza o el rango de cualquier agrupación más
+gruesa se obtienen agregando celdas del cubo, sin volver a recorrer las
+transacciones. Las medianas y los conteos de valores distintos no son
+combinables: se responden con estructuras propias (``QuantileSketches`` y
+``ActivityTable``).
+"""
+
+from __future__ import annotations
+
+import pandas as pd
+
+# Funciones que se pueden responder desde el cubo
+CUBE_FUNCS = {"sum", "count", "mean", "min", "max", "var", "std"}
+
+
+def build_cube(
+    df: pd.DataFrame,
+    keys: list[str],
+    value: str = "value_usd",
+    count_columns: list[str] = (),
+) -> pd.DataFrame:
+    """Agrega ``df`` por ``keys`` con las medidas combinables de ``value``.
+
+    Las claves faltantes forman sus propias celdas (para que los totales sin
+    filtro incluyan esas filas). ``count_columns`` agrega conteos de valores
+    no nulos de otras columnas, como ``count_<columna>``.
+    """
+    work = df[list(keys)].assign(
+        _value=df[value],
+        _square=df[value] * df[value],
+        **{f"count_{col}": df[col].notna() for col in count_columns},
+    )
+    grouped = work.groupby(list(keys), observed=True, dropna=False, sort=True)
+    cube = grouped.agg(
+        sum=("_value", "sum"),
+        count=("_value", "count"),
+        sumsq=("_square", "sum"),
+        min=("_value", "min"),
+        max=("_value", "max"),
+        **{f"count_{col}": (f"count_{col}", "sum") for col in count_columns},
+    )
+    return cube.reset_index()
+
+
+def cube_column(cube: pd.DataFrame, col: str, func: str, value: str = "value_usd") -> bool:
+    """Indica si la medida ``(col, func)`` se puede responder con ``cube``."""
+    if func == "count":
+        return col == value or f"count_{col}" in cube.columns
+    return col == value and func in CUBE_FUNCS
+
+
+def _finish(parts: pd.DataFrame, measures: dict, value: str) -> pd.DataFrame:
+    out = {}
+    for name, (col, func) in measures.items():
+        if func == "count":
+            out[name] = parts["count"] if col == value else parts[f"count_{col}"]
+        elif func == "sum":
+            out[name] = parts["sum"]
+        elif func in ("min", "max"):
+            out[name] = parts[func]
+        elif func == "mean":
+            out[name] = parts["sum"] / parts["count"]
+        else:
+            # Varianza muestral a partir de la suma y la suma de cuadrados
+            n = parts["count"]
+            spread = parts["sumsq"] - parts["sum"] ** 2 / n
+            # Diferencias del orden del redondeo corresponden a valores iguales
+            spread = spread.where(spread > parts["sumsq"] * 1e-12, 0)
+            var = (spread / (n - 1)).where(n > 1)
+            out[name] = var**0.5 if func == "std" else var
+    return pd.DataFrame(out, index=parts.index)
+
+
+def _merge_spec(cells: pd.DataFrame) -> dict:
+    """Cómo se combinan las medidas del cubo al juntar celdas."""
+    spec = {}
+    for col in cells.columns:
+        if col in ("min", "max"):
+            spec[col] = col
+        elif col in ("sum", "count", "sumsq") or col.startswith("count_"):
+            spec[col] = "sum"
+    return spec
+
+
+def rollup(cells: pd.DataFrame, by: list[str], measures: dict, value: str = "value_usd") -> pd.DataFrame:
+    """Agrupa celdas del cubo por ``by``; mismo resultado que ``groupby().agg``.
+
+    ``measures`` es ``{nombre: (columna, func)}`` y solo admite medidas para
+    las que ``cube_column`` es verdadero.
+    """
+    cells = cells.dropna(subset=list(by))
+    parts = cells.groupby(list(by), observed=True).agg(_merge_spec(cells))
+    return _finish(parts, measures, value).reset_index()
+
+
+def total(cells: pd.DataFrame, measures: dict, value: str = "value_usd") -> dict:
+    """Como ``rollup`` sin agrupar: un valor por medida."""
+    parts = cells.agg(_merge_spec(cells)).to_frame().T
+    return _finish(parts, measures, value).iloc[0].to_dict()
@@ -3,7 +3,27 @@ import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from sectores_page import render as render_sectores
-from macrosectores import macrosectores_dict, get_macrosector
+from iati_data import build_commitments, read_iati, data_version as iati_data_version
+from schema import IATI_SCHEMA, IDS_SCHEMA, apply_schema
+from shared_data import shared
+from data_grid import DataGrid, render_grid
+from config import TRANSACCIONES_BACKEND
+from dataclasses import replace
+from transacciones_backend import (
+    CATEGORY_COLUMNS,
+    INSTITUCIONES,
+    PAISES_TRANSACCIONES,
+    FilterSpec,
+    create_backend,
+)
+from small_multiples import facet_traces, grid_positions, grid_shape
+from ids_data import (
+    build_ids_cube, build_ids_long, build_ids_views, country_labels, country_panels, level_values, view_rows
+)
+
+# Copy-on-write de pandas: las vistas de los datasets compartidos entre
+# sesiones (shared_data.view) no copian datos hasta que una página los modifica
+pd.set_option("mode.copy_on_write", True)
 
 # Diccionario de regiones
 regiones_dict = {
@@ -51,12 +71,66 @@ def handle_multiselect_behavior(selected_options, all_options, select_all_text="
     return all_options
 
 # Cargar datos
-@st.cache_data
+@shared
 def load_data():
-    return pd.read_parquet('IDS.parquet')
+    df_ids = pd.read_parquet('IDS.parquet')
+    country_cols = [col for col in df_ids.columns if '[' in col and ']' in col]
+    return apply_schema(df_ids, IDS_SCHEMA, 'IDS', amount_columns=country_cols)
 
 df = load_data()
 
+# Almacén largo del IDS, construido una sola vez a partir del frame ancho
+@shared
+def load_ids_long():
+    return build_ids_long(load_data())
+
+# Cubo del IDS sin duplicados y sus vistas por página
+@shared
+def load_ids_cube():
+    cube, report = build_ids_cube(load_ids_long())
+    return cube, report, build_ids_views(cube)
+
+ids_cube, ids_report, ids_views = load_ids_cube()
+
+# Grilla del Visor BDD con sus índices de búsqueda, filtro y orden
+@shared
+def load_ids_grid():
+    return DataGrid(
+        load_data(),
+        search=['SC2', 'SC3', 'SC4', 'Multilateral'],
+        filters=['SC2', 'SC3', 'SC4', 'Multilateral', 'Time'],
+    )
+ids_countries = country_labels(df)
+
+# Países de las páginas Plazos y Tasas y Comprometido, con su título
+PAISES_PANELES = {
+    'Argentina [ARG]': 'Argentina',
+    'Bolivia [BOL]': 'Bolivia',
+    'Brazil [BRA]': 'Brasil',
+    'Paraguay [PRY]': 'Paraguay',
+}
+
+def render_country_panels(panels, make_figure, empty_message, n_cols=2):
+    """Dibuja un gráfico por país en una grilla de ``n_cols`` columnas.
+
+    ``panels`` es el resultado de ``country_panels``; ``make_figure`` recibe
+    las filas y la etiqueta del país y devuelve la figura. ``empty_message``
+    se completa con el título del país cuando no hay datos.
+    """
+    labels = list(panels)
+    for start in range(0, len(labels), n_cols):
+        for col, label in zip(st.columns(n_cols), labels[start:start + n_cols]):
+            titulo = PAISES_PANELES.get(label, label)
+            rows = panels[label]
+            with col:
+                if rows is None:
+                    st.info(f'No se encontró la columna de {titulo}.')
+                elif rows.empty:
+                    st.info(empty_message.format(titulo))
+                else:
+                    st.markdown(f"<h3 style='text-align: center;'>{titulo}</h3>", unsafe_allow_html=True)
+                    st.plotly_chart(make_figure(rows, label), use_container_width=True)
+
 # Sidebar para navegación
 st.sidebar.title('Navegación')
 st.sidebar.markdown('**IDS**')
@@ -87,21 +161,61 @@ st.sidebar.radio('Ir a:', paginas_iati, key='pagina_iati', index=None, on_change
 
 pagina = st.session_state.get('pagina', st.session_state.get('pagina_ids', 'Deuda externa'))
 
+# Años que muestra la página de Transacciones (límites de sus sliders)
+TRANSACCIONES_YEARS = (2010, 2024)
+
 # Cargar datos IATI
-@st.cache_data
-def load_iati_data():
+@shared(max_entries=1)
+def load_iati_data(data_version=None):
     try:
-        return pd.read_parquet('BDDGLOBALMERGED_ACTUALIZADO.parquet')
+        # Solo las columnas usadas, las transacciones "Outgoing Commitment" y
+        # las particiones year=... de los años de la página
+        return apply_schema(read_iati(years=TRANSACCIONES_YEARS), IATI_SCHEMA, 'IATI')
     except:
         return None
 
-df_iati = load_iati_data()
+# Tabla de compromisos derivada, construida una vez por versión de los datos
+@shared(max_entries=1)
+def load_commitments(data_version=None):
+    df_raw = load_iati_data(data_version)
+    if df_raw is None:
+        return None
+    return build_commitments(df_raw)
+
+# Backend de cálculo de las subpáginas de Transacciones (pandas o Polars)
+@shared(max_entries=1)
+def load_transacciones_backend(data_version=None, name=TRANSACCIONES_BACKEND):
+    df_commitments = load_commitments(data_version)
+    if df_commitments is None:
+        return None
+    return create_backend(df_commitments, name)
+
+# Grilla de compromisos con índice de prefijos sobre iatiidentifier
+@shared(max_entries=1)
+def load_commitments_grid(data_version=None):
+    df_commitments = load_commitments(data_version)
+    if df_commitments is None:
+        return None
+    columnas = [
+        'iatiidentifier', 'transactiondate_isodate', 'prefix', 'recipientcountry_codename',
+        'modality', 'macrosector', 'sector_codename', 'value_usd',
+    ]
+    return DataGrid(
+        df_commitments[[c for c in columnas if c in df_commitments.columns]],
+        search=['iatiidentifier', 'sector_codename'],
+        filters=['prefix', 'recipientcountry_codename', 'modality', 'macrosector', 'value_usd'],
+        prefix='iatiidentifier',
+    )
+
+iati_version = iati_data_version()
+df_commitments = load_commitments(iati_version)
+transacciones_backend = load_transacciones_backend(iati_version)
 
 
 if pagina == 'Deuda externa':
     st.title('Deuda externa')
     # Filtros en la sidebar
-    paises = [col for col in df.columns if '[' in col and ']' in col and not col.startswith('PIB') and not col.startswith('%')]
+    paises = list(ids_countries)
     pais = st.sidebar.selectbox('Selecciona país', paises)
     # Filtro adicional para SC4
     sc4_allowed = [
@@ -111,7 +225,7 @@ if pagina == 'Deuda externa':
         "Public Sector",
     ]
     sc4_options = [
-        opt for opt in sc4_allowed if 'SC4' in df.columns and opt in df['SC4'].dropna().unique()
+        opt for opt in sc4_allowed if opt in level_values(ids_cube, 'SC4')
     ]
     sc4 = st.sidebar.selectbox('Selecciona SC4', sc4_options) if sc4_options else None
     # Filtro adicional para SC2
@@ -125,14 +239,13 @@ if pagina == 'Deuda externa':
         "Total debt service (AMT + INT)",
     ]
     sc2_options = [
-        opt for opt in sc2_allowed if 'SC2' in df.columns and opt in df['SC2'].dropna().unique()
+        opt for opt in sc2_allowed if opt in level_values(ids_cube, 'SC2')
     ]
     sc2 = st.sidebar.selectbox('Selecciona SC2', sc2_options) if sc2_options else None
-    df_filtrado = df.copy()
-    if sc4 is not None:
-        df_filtrado = df_filtrado[df_filtrado['SC4'] == sc4]
-    if sc2 is not None:
-        df_filtrado = df_filtrado[df_filtrado['SC2'] == sc2]
+    # Serie del país seleccionado desde el cubo (un valor por año y SC3)
+    df_filtrado = view_rows(
+        ids_views['sc3'], ids_countries.get(pais, []), ['Time', 'SC3'], SC2=sc2, SC4=sc4
+    ).rename(columns={'value': pais})
     df_filtrado = df_filtrado[df_filtrado['Time'] <= 2023]
     # Filtro por rango de años
     if 'Time' in df_filtrado.columns and not df_filtrado['Time'].empty:
@@ -146,10 +259,9 @@ if pagina == 'Deuda externa':
     st.subheader(f'Gráficos para {pais}')
     import plotly.express as px
     if pais in df_filtrado.columns:
-        df_pais = df_filtrado[["SC3", "Time", pais]].dropna()
-        df_pais = df_pais[~df_pais["SC3"].str.contains("All creditors", case=False, na=False)]
-        # Tomar el valor máximo por año y SC3 para evitar duplicados (mantiene el valor más significativo)
-        df_pais_agg = df_pais.groupby(['Time', 'SC3'])[pais].max().reset_index()
+        # El cubo ya tiene el valor máximo por año y SC3 (sin duplicados)
+        df_pais_agg = df_filtrado[["Time", "SC3", pais]]
+        df_pais_agg = df_pais_agg[~df_pais_agg["SC3"].str.contains("All creditors", case=False, na=False)].reset_index(drop=True)
         # Paleta de colores específica para categorías de deuda externa
         sc3_categories = df_pais_agg['SC3'].unique()
         base_palette = [
@@ -225,7 +337,7 @@ if pagina == 'Deuda externa':
 elif pagina == 'Multilaterales':
     st.title('Multilaterales')
     # Filtros país y SC2
-    paises = [col for col in df.columns if '[' in col and ']' in col and not col.startswith('PIB') and not col.startswith('%')]
+    paises = list(ids_countries)
     pais = st.sidebar.selectbox('Selecciona país', paises)
     allowed_sc2 = [
         'Debt outstanding and disbursed',
@@ -236,15 +348,12 @@ elif pagina == 'Multilaterales':
         'principal repayments',
         'Total debt service (AMT + INT)'
     ]
-    if 'SC2' in df.columns:
-        sc2_options = [opt for opt in allowed_sc2 if opt in df['SC2'].dropna().unique()]
-    else:
-        sc2_options = []
+    sc2_options = [opt for opt in allowed_sc2 if opt in level_values(ids_cube, 'SC2')]
     sc2 = st.sidebar.selectbox('Selecciona SC2', sc2_options) if sc2_options else None
-    # Filtrado
-    df_filtrado = df.copy()
-    if sc2 is not None:
-        df_filtrado = df_filtrado[df_filtrado['SC2'] == sc2]
+    # Filtrado: serie del país seleccionado desde el cubo (un valor por año y multilateral)
+    df_filtrado = view_rows(
+        ids_views['multilateral_sc3'], ids_countries.get(pais, []), ['Time', 'Multilateral'], SC2=sc2
+    ).rename(columns={'value': pais})
     df_filtrado = df_filtrado[df_filtrado['Time'] <= 2023]
     # Filtro por rango de años
     if 'Time' in df_filtrado.columns and not df_filtrado['Time'].empty:
@@ -254,7 +363,7 @@ elif pagina == 'Multilaterales':
         df_filtrado = df_filtrado[(df_filtrado['Time'] >= year_range[0]) & (df_filtrado['Time'] <= year_range[1])]
     # El dataframe filtrado por país se usará en los gráficos
     if pais in df_filtrado.columns:
-        df_pais = df_filtrado[["Multilateral", "SC3", "Time", pais]].dropna()
+        df_pais = df_filtrado[["Time", "Multilateral", pais]]
         df_pais = df_pais[~df_pais["Multilateral"].str.strip().str.lower().eq("world")]
     else:
         df_pais = None
@@ -262,8 +371,8 @@ elif pagina == 'Multilaterales':
 
     # Gráficos solo si hay datos para el país seleccionado
     if df_pais is not None and not df_pais.empty:
-        # Tomar el valor máximo por año y multilateral para evitar duplicados (mantiene el valor más significativo)
-        df_pais_agg = df_pais.groupby(['Time', 'Multilateral'])[pais].max().reset_index()
+        # El cubo ya tiene el valor máximo por año y multilateral (sin duplicados)
+        df_pais_agg = df_pais.reset_index(drop=True)
         
         import plotly.express as px
         st.subheader(f'Gráficos para {pais}')
@@ -340,7 +449,7 @@ elif pagina == 'Multilaterales':
 elif pagina == 'Plazos y Tasas':
     st.title('Plazos y Tasas')
     # Filtro Multilateral y SC2
-    multilaterales = [m for m in df['Multilateral'].dropna().unique() if m.strip().lower() != 'world']
+    multilaterales = [m for m in level_values(ids_cube, 'Multilateral') if m.strip().lower() != 'world']
     multilateral = st.sidebar.selectbox('Selecciona Multilateral', multilaterales)
     sc2_allowed = [
         'Average grace period on new external commitments',
@@ -348,11 +457,14 @@ elif pagina == 'Plazos y Tasas':
         'Average interest on new external debt commitments',
         'Average maturity on new external debt commitments',
     ]
-    sc2_options = [opt for opt in sc2_allowed if 'SC2' in df.columns and opt in df['SC2'].dropna().unique()]
+    sc2_options = [opt for opt in sc2_allowed if opt in level_values(ids_cube, 'SC2')]
     sc2 = st.sidebar.selectbox('Selecciona SC2', sc2_options) if sc2_options else None
-    df_filtrado = df[df['Multilateral'] == multilateral]
-    if sc2 is not None:
-        df_filtrado = df_filtrado[df_filtrado['SC2'] == sc2]
+    # Países de la página (cualquier lista de columnas del IDS)
+    paises_pagina = list(PAISES_PANELES)
+    df_filtrado = view_rows(
+        ids_views['multilateral'], [ids_countries[p] for p in paises_pagina if p in ids_countries], ['Time'],
+        SC2=sc2, Multilateral=multilateral
+    )
     df_filtrado = df_filtrado[df_filtrado['Time'] <= 2023]
     # Filtro por rango de años
     if 'Time' in df_filtrado.columns and not df_filtrado['Time'].empty:
@@ -360,108 +472,32 @@ elif pagina == 'Plazos y Tasas':
         max_year = int(df_filtrado['Time'].max())
         year_range = st.sidebar.slider('Rango de años', min_year, max_year, (min_year, max_year), key='plazos_anos')
         df_filtrado = df_filtrado[(df_filtrado['Time'] >= year_range[0]) & (df_filtrado['Time'] <= year_range[1])]
-    # Definir países
-    pais_arg = 'Argentina [ARG]'
-    paises_grupo = ['Brazil [BRA]', 'Bolivia [BOL]', 'Paraguay [PRY]']
-    # Verificar que existan las columnas
-    cols_arg = [col for col in [pais_arg] if col in df_filtrado.columns]
-    cols_grupo = [col for col in paises_grupo if col in df_filtrado.columns]
-    # Dataframes para gráficos
-    df_arg = df_filtrado[['Time'] + cols_arg].dropna()
-    df_grupo = df_filtrado[['Time'] + cols_grupo].dropna()
-
-    # Gráficos organizados en filas
+    # Una tabla por país (el cubo ya tiene un valor por año, sin duplicados)
     import plotly.express as px
-    from streamlit import columns
-    
-    # Primera fila: Argentina y Bolivia
-    col1, col2 = st.columns(2)
-    
-    if not df_arg.empty:
-        # Tomar el valor máximo por año para evitar duplicados (mantiene el valor más significativo)
-        df_arg_agg = df_arg.groupby('Time')[pais_arg].max().reset_index()
-        with col1:
-            st.markdown("<h3 style='text-align: center;'>Argentina</h3>", unsafe_allow_html=True)
-            fig_arg = px.bar(df_arg_agg, x='Time', y=pais_arg, title='', color_discrete_sequence=['#fca311'], height=300)
-            fig_arg.update_xaxes(showgrid=False, tickangle=45)
-            fig_arg.update_yaxes(showgrid=False)
-            fig_arg.update_layout(title={'text': '', 'x': 0.5, 'xanchor': 'center'})
-            st.plotly_chart(fig_arg, use_container_width=True)
-    else:
-        with col1:
-            st.info('No hay datos para Argentina con el Multilateral seleccionado.')
-    
-    # Buscar Bolivia en el dataframe
-    bolivia_col = 'Bolivia [BOL]'
-    if bolivia_col in df_filtrado.columns:
-        df_bolivia = df_filtrado[['Time', bolivia_col]].dropna()
-        if not df_bolivia.empty:
-            # Tomar el valor máximo por año para evitar duplicados (mantiene el valor más significativo)
-            df_bolivia_agg = df_bolivia.groupby('Time')[bolivia_col].max().reset_index()
-            with col2:
-                st.markdown("<h3 style='text-align: center;'>Bolivia</h3>", unsafe_allow_html=True)
-                fig_bolivia = px.bar(df_bolivia_agg, x='Time', y=bolivia_col, title='', color_discrete_sequence=['#fca311'], height=300)
-                fig_bolivia.update_xaxes(showgrid=False, tickangle=45)
-                fig_bolivia.update_yaxes(showgrid=False)
-                fig_bolivia.update_layout(title={'text': '', 'x': 0.5, 'xanchor': 'center'})
-                st.plotly_chart(fig_bolivia, use_container_width=True)
-        else:
-            with col2:
-                st.info('No hay datos para Bolivia con el Multilateral seleccionado.')
-    else:
-        with col2:
-            st.info('No se encontró la columna de Bolivia.')
-    
-    # Segunda fila: Brasil y Paraguay
-    col3, col4 = st.columns(2)
-    
-    # Brasil
-    brasil_col = 'Brazil [BRA]'
-    if brasil_col in df_filtrado.columns:
-        df_brasil = df_filtrado[['Time', brasil_col]].dropna()
-        if not df_brasil.empty:
-            # Tomar el valor máximo por año para evitar duplicados (mantiene el valor más significativo)
-            df_brasil_agg = df_brasil.groupby('Time')[brasil_col].max().reset_index()
-            with col3:
-                st.markdown("<h3 style='text-align: center;'>Brasil</h3>", unsafe_allow_html=True)
-                fig_brasil = px.bar(df_brasil_agg, x='Time', y=brasil_col, title='', color_discrete_sequence=['#fca311'], height=300)
-                fig_brasil.update_xaxes(showgrid=False, tickangle=45)
-                fig_brasil.update_yaxes(showgrid=False)
-                fig_brasil.update_layout(title={'text': '', 'x': 0.5, 'xanchor': 'center'})
-                st.plotly_chart(fig_brasil, use_container_width=True)
-        else:
-            with col3:
-                st.info('No hay datos para Brasil con el Multilateral seleccionado.')
-    else:
-        with col3:
-            st.info('No se encontró la columna de Brasil.')
-    
-    # Paraguay
-    paraguay_col = 'Paraguay [PRY]'
-    if paraguay_col in df_filtrado.columns:
-        df_paraguay = df_filtrado[['Time', paraguay_col]].dropna()
-        if not df_paraguay.empty:
-            # Tomar el valor máximo por año para evitar duplicados (mantiene el valor más significativo)
-            df_paraguay_agg = df_paraguay.groupby('Time')[paraguay_col].max().reset_index()
-            with col4:
-                st.markdown("<h3 style='text-align: center;'>Paraguay</h3>", unsafe_allow_html=True)
-                fig_paraguay = px.bar(df_paraguay_agg, x='Time', y=paraguay_col, title='', color_discrete_sequence=['#fca311'], height=300)
-                fig_paraguay.update_xaxes(showgrid=False, tickangle=45)
-                fig_paraguay.update_yaxes(showgrid=False)
-                fig_paraguay.update_layout(title={'text': '', 'x': 0.5, 'xanchor': 'center'})
-                st.plotly_chart(fig_paraguay, use_container_width=True)
-        else:
-            with col4:
-                st.info('No hay datos para Paraguay con el Multilateral seleccionado.')
-    else:
-        with col4:
-            st.info('No se encontró la columna de Paraguay.')
+    panels = country_panels(df_filtrado, ids_countries, paises_pagina, ['Time'])
+
+    def plazos_figure(rows, label):
+        fig = px.bar(rows, x='Time', y=label, title='', color_discrete_sequence=['#fca311'], height=300)
+        fig.update_xaxes(showgrid=False, tickangle=45)
+        fig.update_yaxes(showgrid=False)
+        fig.update_layout(title={'text': '', 'x': 0.5, 'xanchor': 'center'})
+        return fig
+
+    render_country_panels(panels, plazos_figure, 'No hay datos para {} con el Multilateral seleccionado.')
 
 elif pagina == 'Comprometido':
     st.title('Comprometido')
 
-    # Filtrar por SC2 = "Commitments"
-    df_comprometido = df[df['SC2'] == 'Commitments'].copy()
+    # Filtrar por SC2 = "Commitments" para los países de la página
+    paises = list(PAISES_PANELES)
+    
+    # Verificar que existan las columnas de países
+    paises_disponibles = [pais for pais in paises if pais in ids_countries]
+    
+    df_comprometido = view_rows(
+        ids_views['multilateral'], [ids_countries[p] for p in paises_disponibles], ['Time', 'Multilateral'],
+        SC2='Commitments'
+    )
     df_comprometido = df_comprometido[~df_comprometido['Multilateral'].str.strip().str.lower().eq('world')]
     df_comprometido = df_comprometido[df_comprometido['Time'] <= 2023]
     # Filtro por rango de años
@@ -487,196 +523,64 @@ elif pagina == 'Comprometido':
         'WB-MIGA': '#ffbb78'
     }
     
-    # Definir países
-    paises = ['Argentina [ARG]', 'Bolivia [BOL]', 'Brazil [BRA]', 'Paraguay [PRY]']
-    
-    # Verificar que existan las columnas de países
-    paises_disponibles = [pais for pais in paises if pais in df_comprometido.columns]
-    
     if paises_disponibles:
         import plotly.express as px
-        from streamlit import columns
-        
-        # Primera fila: Argentina y Bolivia
-        col1, col2 = st.columns(2)
-        
-        # Argentina
-        if 'Argentina [ARG]' in paises_disponibles:
-            df_arg = df_comprometido[["Multilateral", "Time", "Argentina [ARG]"]].dropna()
-            if not df_arg.empty:
-                # Tomar el valor máximo por año y multilateral para evitar duplicados (mantiene el valor más significativo)
-                df_arg_agg = df_arg.groupby(['Time', 'Multilateral'])['Argentina [ARG]'].max().reset_index()
-                with col1:
-                    st.markdown("<h3 style='text-align: center;'>Argentina</h3>", unsafe_allow_html=True)
-                    fig_arg = px.bar(
-                        df_arg_agg,
-                        x='Time',
-                        y='Argentina [ARG]',
-                        color='Multilateral',
-                        color_discrete_map=multilateral_colors,
-                        title='USD',
-                        height=300
-                    )
-                    fig_arg.update_xaxes(showgrid=False, tickangle=45)
-                    fig_arg.update_yaxes(showgrid=False, tickformat='.2s', title_text='Argentina [ARG] (millones USD)')
-                    fig_arg.update_traces(
-                        hovertemplate="<b>Año:</b> %{x}<br><b>Multilateral:</b> %{fullData.name}<br><b>Valor:</b> %{y:.2s} USD<extra></extra>"
-                    )
-                    fig_arg.update_layout(
-                        title={'text': 'USD', 'x': 0.5, 'xanchor': 'center'},
-                        showlegend=False
-                    )
-                    st.plotly_chart(fig_arg, use_container_width=True)
-            else:
-                with col1:
-                    st.info('No hay datos para Argentina con SC2 = Commitments.')
-        else:
-            with col1:
-                st.info('No se encontró la columna de Argentina.')
-        
-        # Bolivia
-        if 'Bolivia [BOL]' in paises_disponibles:
-            df_bol = df_comprometido[["Multilateral", "Time", "Bolivia [BOL]"]].dropna()
-            if not df_bol.empty:
-                # Tomar el valor máximo por año y multilateral para evitar duplicados (mantiene el valor más significativo)
-                df_bol_agg = df_bol.groupby(['Time', 'Multilateral'])['Bolivia [BOL]'].max().reset_index()
-                with col2:
-                    st.markdown("<h3 style='text-align: center;'>Bolivia</h3>", unsafe_allow_html=True)
-                    fig_bol = px.bar(
-                        df_bol_agg,
-                        x='Time',
-                        y='Bolivia [BOL]',
-                        color='Multilateral',
-                        color_discrete_map=multilateral_colors,
-                        title='USD',
-                        height=300
-                    )
-                    fig_bol.update_xaxes(showgrid=False, tickangle=45)
-                    fig_bol.update_yaxes(showgrid=False, tickformat='.2s', title_text='Bolivia [BOL] (millones USD)')
-                    fig_bol.update_traces(
-                        hovertemplate="<b>Año:</b> %{x}<br><b>Multilateral:</b> %{fullData.name}<br><b>Valor:</b> %{y:.2s} USD<extra></extra>"
-                    )
-                    fig_bol.update_layout(
-                        title={'text': 'USD', 'x': 0.5, 'xanchor': 'center'},
-                        showlegend=False
-                    )
-                    st.plotly_chart(fig_bol, use_container_width=True)
-            else:
-                with col2:
-                    st.info('No hay datos para Bolivia con SC2 = Commitments.')
-        else:
-            with col2:
-                st.info('No se encontró la columna de Bolivia.')
-        
-        # Segunda fila: Brasil y Paraguay
-        col3, col4 = st.columns(2)
-        
-        # Brasil
-        if 'Brazil [BRA]' in paises_disponibles:
-            df_bra = df_comprometido[["Multilateral", "Time", "Brazil [BRA]"]].dropna()
-            if not df_bra.empty:
-                # Tomar el valor máximo por año y multilateral para evitar duplicados (mantiene el valor más significativo)
-                df_bra_agg = df_bra.groupby(['Time', 'Multilateral'])['Brazil [BRA]'].max().reset_index()
-                with col3:
-                    st.markdown("<h3 style='text-align: center;'>Brasil</h3>", unsafe_allow_html=True)
-                    fig_bra = px.bar(
-                        df_bra_agg,
-                        x='Time',
-                        y='Brazil [BRA]',
-                        color='Multilateral',
-                        color_discrete_map=multilateral_colors,
-                        title='USD',
-                        height=300
-                    )
-                    fig_bra.update_xaxes(showgrid=False, tickangle=45)
-                    fig_bra.update_yaxes(showgrid=False, tickformat='.2s', title_text='Brazil [BRA] (millones USD)')
-                    fig_bra.update_traces(
-                        hovertemplate="<b>Año:</b> %{x}<br><b>Multilateral:</b> %{fullData.name}<br><b>Valor:</b> %{y:.2s} USD<extra></extra>"
-                    )
-                    fig_bra.update_layout(
-                        title={'text': 'USD', 'x': 0.5, 'xanchor': 'center'},
-                        showlegend=False
-                    )
-                    st.plotly_chart(fig_bra, use_container_width=True)
-            else:
-                with col3:
-                    st.info('No hay datos para Brasil con SC2 = Commitments.')
-        else:
-            with col3:
-                st.info('No se encontró la columna de Brasil.')
-        
-        # Paraguay
-        if 'Paraguay [PRY]' in paises_disponibles:
-            df_pry = df_comprometido[["Multilateral", "Time", "Paraguay [PRY]"]].dropna()
-            if not df_pry.empty:
-                # Tomar el valor máximo por año y multilateral para evitar duplicados (mantiene el valor más significativo)
-                df_pry_agg = df_pry.groupby(['Time', 'Multilateral'])['Paraguay [PRY]'].max().reset_index()
-                with col4:
-                    st.markdown("<h3 style='text-align: center;'>Paraguay</h3>", unsafe_allow_html=True)
-                    fig_pry = px.bar(
-                        df_pry_agg,
-                        x='Time',
-                        y='Paraguay [PRY]',
-                        color='Multilateral',
-                        color_discrete_map=multilateral_colors,
-                        title='USD',
-                        height=300
-                    )
-                    fig_pry.update_xaxes(showgrid=False, tickangle=45)
-                    fig_pry.update_yaxes(showgrid=False, tickformat='.2s', title_text='Paraguay [PRY] (millones USD)')
-                    fig_pry.update_traces(
-                        hovertemplate="<b>Año:</b> %{x}<br><b>Multilateral:</b> %{fullData.name}<br><b>Valor:</b> %{y:.2s} USD<extra></extra>"
-                    )
-                    fig_pry.update_layout(
-                        title={'text': 'USD', 'x': 0.5, 'xanchor': 'center'},
-                        showlegend=False
-                    )
-                    st.plotly_chart(fig_pry, use_container_width=True)
-            else:
-                with col4:
-                    st.info('No hay datos para Paraguay con SC2 = Commitments.')
-        else:
-            with col4:
-                st.info('No se encontró la columna de Paraguay.')
+        # Una tabla por país (el cubo ya tiene un valor por año y multilateral)
+        panels = country_panels(df_comprometido, ids_countries, paises, ["Multilateral", "Time"])
+
+        def comprometido_figure(rows, label):
+            fig = px.bar(
+                rows,
+                x='Time',
+                y=label,
+                color='Multilateral',
+                color_discrete_map=multilateral_colors,
+                title='USD',
+                height=300
+            )
+            fig.update_xaxes(showgrid=False, tickangle=45)
+            fig.update_yaxes(showgrid=False, tickformat='.2s', title_text=f'{label} (millones USD)')
+            fig.update_traces(
+                hovertemplate="<b>Año:</b> %{x}<br><b>Multilateral:</b> %{fullData.name}<br><b>Valor:</b> %{y:.2s} USD<extra></extra>"
+            )
+            fig.update_layout(
+                title={'text': 'USD', 'x': 0.5, 'xanchor': 'center'},
+                showlegend=False
+            )
+            return fig
+
+        render_country_panels(panels, comprometido_figure, 'No hay datos para {} con SC2 = Commitments.')
     
     else:
         st.info('No se encontraron datos con SC2 = "Commitments" para los países especificados.')
 
 elif pagina == 'Visor BDD':
     st.title('Visor BDD')
-    # Parámetros de paginación
-    page_size = 10  # Observaciones por página
-    total_rows = len(df)
-    total_pages = (total_rows - 1) // page_size + 1
-
-    page = st.number_input(
-        'Página',
-        min_value=1,
-        max_value=total_pages,
-        value=1,
-        step=1,
-        help=f"Total de páginas: {total_pages}"
+    # Paginación, búsqueda y orden resueltos en el servidor
+    render_grid(load_ids_grid(), "visor", page_size=10)
+    st.caption(
+        f"Cubo IDS: {ids_report['celdas']:,} celdas, "
+        f"{ids_report['duplicados']:,} duplicados colapsados de {ids_report['filas']:,} filas"
     )
 
-    start_idx = (page - 1) * page_size
-    end_idx = start_idx + page_size
-    st.dataframe(df.iloc[start_idx:end_idx])
-    st.caption(f"Mostrando filas {start_idx+1} a {min(end_idx, total_rows)} de {total_rows}")
-
 elif pagina == 'Transacciones':
     st.title('Transacciones IATI')
     st.markdown("---")
     
-    # Filtros desplegables en el sidebar para la página de Transacciones
-    if df_iati is not None:
+    # Filtros desplegables en el sidebar para la página de Transacciones.
+    # Los filtros de cada subpágina se leen en este mismo rerun (no de
+    # st.session_state), para no usar valores de otra subpágina.
+    subpage_active = "Financiadores"
+    financiadores_spec = FilterSpec(years=TRANSACCIONES_YEARS)
+    paises_years = TRANSACCIONES_YEARS
+    if df_commitments is not None:
         # Crear un selectbox para elegir la subpágina activa
         subpage_active = st.sidebar.selectbox(
             "Subpágina activa:",
-            ["Financiadores", "Países"],
+            ["Financiadores", "Países", "Actividades"],
             index=0,
             key="transacciones_subpage_select"
         )
-        st.session_state['subpage_active'] = subpage_active
 
         # Mostrar filtros según la subpágina seleccionada
         if subpage_active == "Financiadores":
@@ -686,27 +590,15 @@ elif pagina == 'Transacciones':
             # Slider de años
             selected_years = st.sidebar.slider(
                 "Rango de Años:",
-                min_value=2010,
-                max_value=2024,
-                value=(2010, 2024),
+                min_value=TRANSACCIONES_YEARS[0],
+                max_value=TRANSACCIONES_YEARS[1],
+                value=TRANSACCIONES_YEARS,
                 step=1,
                 key="transacciones_years_slider"
             )
-            st.session_state['selected_years'] = selected_years
-            
-            # Obtener datos filtrados para los filtros
-            outgoing_commitments = df_iati[df_iati['transactiontype_codename'] == 'Outgoing Commitment'].copy()
+            financiadores_spec = FilterSpec(years=tuple(selected_years))
             
-            if len(outgoing_commitments) > 0:
-                # Convertir la columna de fecha
-                outgoing_commitments['transactiondate_isodate'] = pd.to_datetime(outgoing_commitments['transactiondate_isodate'])
-                
-                # Filtrar por años seleccionados
-                outgoing_commitments = outgoing_commitments[
-                    (outgoing_commitments['transactiondate_isodate'].dt.year >= selected_years[0]) & 
-                    (outgoing_commitments['transactiondate_isodate'].dt.year <= selected_years[1])
-                ]
-                
+            if len(df_commitments) > 0:
                 # Filtro de regiones
                 selected_region = st.sidebar.selectbox(
                     "Seleccionar Región:",
@@ -714,15 +606,16 @@ elif pagina == 'Transacciones':
                     index=0,
                     key="transacciones_region_select"
                 )
-                st.session_state['selected_region'] = selected_region
                 
                 # Filtro de países basado en la región seleccionada
-                if selected_region != "Todas las regiones" and 'recipientcountry_codename' in outgoing_commitments.columns:
-                    # Filtrar países por la región seleccionada
+                if selected_region != "Todas las regiones":
+                    # Países de la región con transacciones en el rango de años
                     paises_region = regiones_dict[selected_region]
-                    countries_in_region = [country for country in outgoing_commitments['recipientcountry_codename'].dropna().astype(str).unique() 
-                                         if country in paises_region]
-                    countries = sorted(countries_in_region)
+                    countries = [
+                        country
+                        for country in transacciones_backend.options(financiadores_spec, 'recipientcountry_codename')
+                        if country in paises_region
+                    ]
                     
                     # Agregar opción "Todos" al inicio
                     countries_with_all = ["Todos"] + countries
@@ -736,127 +629,66 @@ elif pagina == 'Transacciones':
                     
                     # Aplicar comportamiento de multiselect
                     final_countries = handle_multiselect_behavior(selected_countries, countries, "Todos")
-                    st.session_state['selected_countries'] = final_countries
+                    financiadores_spec = replace(
+                        financiadores_spec,
+                        region=tuple(paises_region),
+                        countries=tuple(final_countries),
+                    )
                 
                 # Filtro de modalidades
-                if 'modality' in outgoing_commitments.columns:
-                    modalities = sorted(outgoing_commitments['modality'].dropna().astype(str).unique())
-                    
-                    selected_modality = st.sidebar.selectbox(
-                        "Seleccionar Modalidad:",
-                        ["Todas las modalidades"] + list(modalities),
-                        index=0,
-                        key="transacciones_modality_select"
-                    )
-                    st.session_state['selected_modality'] = selected_modality
+                modalities = transacciones_backend.options(financiadores_spec, 'modality')
+                
+                selected_modality = st.sidebar.selectbox(
+                    "Seleccionar Modalidad:",
+                    ["Todas las modalidades"] + list(modalities),
+                    index=0,
+                    key="transacciones_modality_select"
+                )
+                if selected_modality != "Todas las modalidades":
+                    financiadores_spec = replace(financiadores_spec, modality=selected_modality)
                 
                 # Filtro de macrosectores
-                if 'sector_codename' in outgoing_commitments.columns:
-                    sectors = sorted(outgoing_commitments['sector_codename'].dropna().astype(str).unique())
-                    
-                    # Crear lista de macrosectores disponibles
-                    available_macrosectors = set()
-                    for sector in sectors:
-                        macrosector = get_macrosector(sector)
-                        if macrosector != "No clasificado":
-                            available_macrosectors.add(macrosector)
-                    
-                    available_macrosectors = sorted(list(available_macrosectors))
-                    
-                    # Filtro de macrosectores
-                    selected_macrosector = st.sidebar.selectbox(
-                        "Seleccionar Macrosector:",
-                        ["Todos los macrosectores"] + available_macrosectors,
-                        index=0,
-                        key="transacciones_macrosector_select"
-                    )
-                    st.session_state['selected_macrosector'] = selected_macrosector
+                available_macrosectors = [
+                    m for m in transacciones_backend.options(financiadores_spec, 'macrosector')
+                    if m != "No clasificado"
+                ]
+                
+                selected_macrosector = st.sidebar.selectbox(
+                    "Seleccionar Macrosector:",
+                    ["Todos los macrosectores"] + available_macrosectors,
+                    index=0,
+                    key="transacciones_macrosector_select"
+                )
+                if selected_macrosector != "Todos los macrosectores":
+                    financiadores_spec = replace(financiadores_spec, macrosector=selected_macrosector)
 
         elif subpage_active == "Países":
             st.sidebar.markdown("---")
             st.sidebar.subheader("Filtros (Países)")
 
             # Slider de años
-            selected_years = st.sidebar.slider(
+            paises_years = st.sidebar.slider(
                 "Rango de Años:",
-                min_value=2010,
-                max_value=2024,
-                value=(2010, 2024),
+                min_value=TRANSACCIONES_YEARS[0],
+                max_value=TRANSACCIONES_YEARS[1],
+                value=TRANSACCIONES_YEARS,
                 step=1,
                 key="transacciones_paises_years_slider",
             )
-            st.session_state['selected_years'] = selected_years
-    
-    # Obtener la subpágina activa del sidebar
-    subpage_active = st.session_state.get('subpage_active', 'Financiadores')
-    
-    # Obtener la subpágina activa del sidebar
-    subpage_active = st.session_state.get('subpage_active', 'Financiadores')
     
     if subpage_active == "Financiadores":
         st.subheader("Financiadores")
         st.markdown("---")
         
         # Verificar si los datos IATI están cargados
-        if df_iati is not None:
-            # Filtrar solo transacciones de tipo "Outgoing Commitment"
-            outgoing_commitments = df_iati[df_iati['transactiontype_codename'] == 'Outgoing Commitment'].copy()
+        if df_commitments is not None:
+            # Tabla de compromisos ya tipada y clasificada
+            outgoing_commitments = df_commitments
             
             if len(outgoing_commitments) > 0:
-                # Convertir la columna de fecha
-                outgoing_commitments['transactiondate_isodate'] = pd.to_datetime(outgoing_commitments['transactiondate_isodate'])
-                
-                # Obtener rango de años del sidebar
-                selected_years = st.session_state.get('selected_years', (2010, 2024))
-                
-                # Filtrar por años seleccionados
-                outgoing_commitments = outgoing_commitments[
-                    (outgoing_commitments['transactiondate_isodate'].dt.year >= selected_years[0]) & 
-                    (outgoing_commitments['transactiondate_isodate'].dt.year <= selected_years[1])
-                ]
-                
-                # Obtener filtros del sidebar (solo para Financiadores)
-                selected_modality = st.session_state.get('selected_modality', "Todas las modalidades")
-                selected_macrosector = st.session_state.get('selected_macrosector', "Todos los macrosectores")
-                
-                # Aplicar filtros
-                df_filtered_by_filters = outgoing_commitments.copy()
-                
-                # Filtrar valores negativos
-                df_filtered_by_filters = df_filtered_by_filters[df_filtered_by_filters['value_usd'] > 0]
-                
-                # Filtrar "Other" en modality
-                if 'modality' in df_filtered_by_filters.columns:
-                    df_filtered_by_filters = df_filtered_by_filters[~df_filtered_by_filters['modality'].str.contains('other', case=False, na=False)]
-                
-                # Aplicar filtro de región
-                selected_region = st.session_state.get('selected_region', "Todas las regiones")
-                if selected_region != "Todas las regiones" and 'recipientcountry_codename' in df_filtered_by_filters.columns:
-                    paises_region = regiones_dict[selected_region]
-                    df_filtered_by_filters = df_filtered_by_filters[
-                        df_filtered_by_filters['recipientcountry_codename'].isin(paises_region)
-                    ]
-                
-                # Aplicar filtro de países múltiples
-                selected_countries = st.session_state.get('selected_countries', [])
-                if selected_countries and 'recipientcountry_codename' in df_filtered_by_filters.columns:
-                    # Filtrar por los países seleccionados (ya procesados por handle_multiselect_behavior)
-                    df_filtered_by_filters = df_filtered_by_filters[
-                        df_filtered_by_filters['recipientcountry_codename'].astype(str).isin(selected_countries)
-                    ]
-                
-                if selected_modality != "Todas las modalidades" and 'modality' in df_filtered_by_filters.columns:
-                    df_filtered_by_filters = df_filtered_by_filters[
-                        df_filtered_by_filters['modality'].astype(str) == selected_modality
-                    ]
-                
-                # Aplicar filtro de macrosector
-                if selected_macrosector != "Todos los macrosectores" and 'sector_codename' in df_filtered_by_filters.columns:
-                    # Obtener sectores del macrosector seleccionado
-                    macrosector_sectors = macrosectores_dict.get(selected_macrosector, [])
-                    df_filtered_by_filters = df_filtered_by_filters[
-                        df_filtered_by_filters['sector_codename'].astype(str).isin(macrosector_sectors)
-                    ]
+                # Años, valores positivos, sin modalidad "Other", región, países,
+                # modalidad, macrosector e instituciones según el FilterSpec del sidebar
+                yearly_data = transacciones_backend.financiadores(financiadores_spec)
                 
                 # Definir colores para cada institución
                 colors = {
@@ -866,15 +698,9 @@ elif pagina == 'Transacciones':
                     'worldbank': '#004e89'
                 }
                 
-                # Filtrar por las instituciones específicas
-                instituciones = ['fonplata', 'iadb', 'caf', 'worldbank']
-                df_filtered = df_filtered_by_filters[df_filtered_by_filters['prefix'].isin(instituciones)].copy()
+                instituciones = INSTITUCIONES
                 
-                if len(df_filtered) > 0:
-                    # Agrupar por año y institución para los gráficos de línea
-                    df_filtered['year'] = df_filtered['transactiondate_isodate'].dt.year
-                    yearly_data = df_filtered.groupby(['year', 'prefix'])['value_usd'].sum().reset_index()
-                    
+                if len(yearly_data) > 0:
                     # Convertir valores a millones para mejor visualización
                     yearly_data['value_usd_millions'] = yearly_data['value_usd'] / 1000000
                     
@@ -1008,33 +834,20 @@ elif pagina == 'Transacciones':
         )
         
         # Verificar si los datos IATI están cargados
-        if df_iati is not None:
-            # Filtrar solo transacciones de tipo "Outgoing Commitment"
-            outgoing_commitments = df_iati[df_iati['transactiontype_codename'] == 'Outgoing Commitment'].copy()
+        if df_commitments is not None:
+            # Tabla de compromisos ya tipada y clasificada
+            outgoing_commitments = df_commitments
             
             if len(outgoing_commitments) > 0:
-                # Convertir la columna de fecha
-                outgoing_commitments['transactiondate_isodate'] = pd.to_datetime(outgoing_commitments['transactiondate_isodate'])
-                
-                # Obtener rango de años del sidebar
-                selected_years = st.session_state.get('selected_years', (2010, 2024))
-                
-                # Filtrar por años seleccionados
-                outgoing_commitments = outgoing_commitments[
-                    (outgoing_commitments['transactiondate_isodate'].dt.year >= selected_years[0]) & 
-                    (outgoing_commitments['transactiondate_isodate'].dt.year <= selected_years[1])
-                ]
-                
-                # Filtrar solo los países específicos: AR, BO, BR, PY, UY
-                paises_especificos = ['AR', 'BO', 'BR', 'PY', 'UY']
-                outgoing_commitments = outgoing_commitments[
-                    outgoing_commitments['recipientcountry_code'].isin(paises_especificos)
-                ]
-                
-                # Filtrar valores negativos de value_usd
-                outgoing_commitments = outgoing_commitments[outgoing_commitments['value_usd'] > 0]
+                # Suma anual por país y categoría: años, países específicos,
+                # valores positivos y sin categorías "Other"
+                paises_especificos = list(PAISES_TRANSACCIONES)
+                categoria_column = CATEGORY_COLUMNS[visualization_type]
+                yearly_by_country = transacciones_backend.paises(
+                    paises_years, paises_especificos, visualization_type
+                )
                 
-                if len(outgoing_commitments) > 0:
+                if len(yearly_by_country) > 0:
                     # Definir colores para cada categoría según el tipo de visualización
                     if visualization_type == "MDBs":
                         colors = {
@@ -1043,17 +856,9 @@ elif pagina == 'Transacciones':
                             'caf': '#38b000',
                             'worldbank': '#004e89'
                         }
-                        # Filtrar por las instituciones específicas
-                        categorias = ['fonplata', 'iadb', 'caf', 'worldbank']
-                        df_filtered = outgoing_commitments[outgoing_commitments['prefix'].isin(categorias)].copy()
-                        categoria_column = 'prefix'
+                        categorias = list(INSTITUCIONES)
                         
                     elif visualization_type == "Sectores":
-                        # Agregar columna de macrosector
-                        outgoing_commitments['macrosector'] = outgoing_commitments['sector_codename'].apply(get_macrosector)
-                        df_filtered = outgoing_commitments[outgoing_commitments['macrosector'] != "No clasificado"].copy()
-                        categoria_column = 'macrosector'
-                        
                         # Colores para macrosectores - nueva paleta
                         colors = {
                             'Social': '#15616D',
@@ -1066,119 +871,95 @@ elif pagina == 'Transacciones':
                         categorias = list(colors.keys())
                         
                     elif visualization_type == "Modalidad":
-                        df_filtered = outgoing_commitments.copy()
-                        categoria_column = 'modality'
-                        
-                        # Filtrar "Other" de las modalidades
-                        df_filtered = df_filtered[~df_filtered['modality'].str.contains('other', case=False, na=False)]
-                        
-                        # Obtener modalidades únicas después del filtrado
-                        modalidades_unicas = df_filtered['modality'].dropna().unique()
+                        # Modalidades presentes (ordenadas para que los colores no
+                        # dependan del orden de las filas)
+                        modalidades_unicas = sorted(yearly_by_country['modality'].unique())
                         colors = {}
                         paleta_modalidades = ['#C1121F', '#FDF0D5', '#003049', '#669BBC', '#DF817A']
                         for i, modalidad in enumerate(modalidades_unicas):
                             colors[modalidad] = paleta_modalidades[i % len(paleta_modalidades)]
                         categorias = list(colors.keys())
                     
-                    # Filtrar observaciones que contengan "Other" en cualquier categoría
-                    if visualization_type == "MDBs":
-                        df_filtered = df_filtered[~df_filtered['prefix'].str.contains('other', case=False, na=False)]
-                    elif visualization_type == "Sectores":
-                        df_filtered = df_filtered[~df_filtered['macrosector'].str.contains('other', case=False, na=False)]
-                    # Para Modalidad ya se filtró arriba, no necesitamos filtrar de nuevo
+                    # Crear gráficos individuales para cada país
+                    st.subheader(f"Evolución Anual por País - {visualization_type}")
                     
-                    if len(df_filtered) > 0:
-                        # Agregar columna de año
-                        df_filtered['year'] = df_filtered['transactiondate_isodate'].dt.year
-                        
-                        # Crear gráficos individuales para cada país
-                        st.subheader(f"Evolución Anual por País - {visualization_type}")
-                        
-                        # Definir el orden de los países
-                        paises_orden = ['AR', 'BO', 'BR', 'PY', 'UY']
-                        
-                        # Crear subplots: 2 filas, 3 columnas (primera fila: AR, BO, BR; segunda fila: PY, UY)
-                        fig = make_subplots(
-                            rows=2, cols=3,
-                            subplot_titles=('Argentina', 'Bolivia', 'Brasil', 'Paraguay', 'Uruguay', ''),
-                            specs=[[{"secondary_y": False}, {"secondary_y": False}, {"secondary_y": False}],
-                                   [{"secondary_y": False}, {"secondary_y": False}, {"secondary_y": False}]]
-                        )
-                        
-                        # Posiciones para cada país
-                        positions = {
-                            'AR': (1, 1),  # Primera fila, primera columna
-                            'BO': (1, 2),  # Primera fila, segunda columna
-                            'BR': (1, 3),  # Primera fila, tercera columna
-                            'PY': (2, 1),  # Segunda fila, primera columna
-                            'UY': (2, 2)   # Segunda fila, segunda columna
-                        }
-                        
-                        for pais in paises_orden:
-                            pais_data = df_filtered[df_filtered['recipientcountry_code'] == pais]
-                            
-                            if len(pais_data) > 0:
-                                # Agrupar por año y categoría
-                                pais_yearly_data = pais_data.groupby(['year', categoria_column])['value_usd'].sum().reset_index()
-                                pais_yearly_data['value_usd_millions'] = pais_yearly_data['value_usd'] / 1000000
-                                
-                                # Agregar barras apiladas para cada categoría en este país
-                                for categoria in categorias:
-                                    if categoria in pais_yearly_data[categoria_column].values:
-                                        cat_data = pais_yearly_data[pais_yearly_data[categoria_column] == categoria]
-                                        if len(cat_data) > 0:
-                                            fig.add_trace(
-                                                go.Bar(
-                                                    x=cat_data['year'],
-                                                    y=cat_data['value_usd_millions'],
-                                                    name=categoria.upper() if visualization_type == "MDBs" else categoria,
-                                                    marker_color=colors.get(categoria, '#999999'),
-                                                    hovertemplate='<b>%{fullData.name}</b><br>' +
-                                                                'Año: %{x}<br>' +
-                                                                'Valor: $%{y:.1f}M USD<br>' +
-                                                                '<extra></extra>'
-                                                ),
-                                                row=positions[pais][0], col=positions[pais][1]
-                                            )
+                    # Series de todos los paneles en una sola pasada
+                    trazas = facet_traces(
+                        yearly_by_country, 'recipientcountry_code', categoria_column,
+                        'year', 'value_usd', paises_especificos, categorias
+                    )
+                    
+                    # Grilla de 3 columnas (AR, BO, BR en la primera fila; PY, UY en la segunda)
+                    filas, columnas = grid_shape(len(paises_especificos))
+                    posiciones = grid_positions(len(paises_especificos))
+                    titulos = [PAISES_TRANSACCIONES.get(pais, pais) for pais in paises_especificos]
+                    titulos += [''] * (filas * columnas - len(titulos))
+                    fig = make_subplots(
+                        rows=filas, cols=columnas,
+                        subplot_titles=titulos,
+                        specs=[[{"secondary_y": False}] * columnas for _ in range(filas)]
+                    )
+                    
+                    for pais, (fila, columna) in zip(paises_especificos, posiciones):
+                        # Barras apiladas para cada categoría en este país
+                        for categoria, years, values in trazas[pais]:
+                            fig.add_trace(
+                                go.Bar(
+                                    x=years,
+                                    y=values / 1000000,
+                                    name=categoria.upper() if visualization_type == "MDBs" else categoria,
+                                    marker_color=colors.get(categoria, '#999999'),
+                                    hovertemplate='<b>%{fullData.name}</b><br>' +
+                                                'Año: %{x}<br>' +
+                                                'Valor: $%{y:.1f}M USD<br>' +
+                                                '<extra></extra>'
+                                ),
+                                row=fila, col=columna
+                            )
 
-                        fig.update_layout(
-                            height=800,
-                            barmode='stack',  # Hacer que las barras sean apiladas
-                            showlegend=False
-                        )
-                        
-                        # Actualizar ejes para todos los subplots
-                        for i in range(1, 3):
-                            for j in range(1, 4):
-                                if j == 1:  # Argentina y Paraguay sin título del eje X
-                                    fig.update_xaxes(title_text="", row=i, col=j, showgrid=False)
-                                else:  # Bolivia, Brasil y Uruguay mantienen el título del eje X
-                                    fig.update_xaxes(title_text="Año", row=i, col=j, showgrid=False)
-                                
-                                if j == 1:  # Solo Argentina mantiene el título del eje Y
-                                    fig.update_yaxes(title_text="Valor USD (Millones)", row=i, col=j, showgrid=False)
-                                else:  # Bolivia, Brasil, Paraguay y Uruguay sin título del eje Y
-                                    fig.update_yaxes(title_text="", row=i, col=j, showgrid=False)
-                        
-                        st.plotly_chart(fig, use_container_width=True)
-                        # Leyenda superpuesta sobre el gráfico de Uruguay (segunda fila, segunda columna)
-                        st.markdown(
-                            f"""
-                            <div style='position:relative; width:100%; height:0;'>
-                                <div style='position:absolute; right:-2vw; top:-22vw; z-index:10; background:#23272e; padding:16px 20px 16px 16px; border-radius:10px; box-shadow:0 2px 8px rgba(0,0,0,0.08); min-width:220px;'>
-                                    <b style='color:#fff'>{'Instituciones' if visualization_type=='MDBs' else ('Macrosector' if visualization_type=='Sectores' else 'Modalidad')}:</b><br>
-                                    {''.join([f"<div style='display:flex;align-items:center;gap:6px;margin-top:8px;'><div style='width:18px;height:18px;background:{color};border-radius:3px;border:1px solid #888;'></div><span style='font-size:15px;color:#fff'>{nombre}</span></div>" for nombre, color in colors.items()])}
-                                </div>
+                    fig.update_layout(
+                        height=400 * filas,
+                        barmode='stack',  # Hacer que las barras sean apiladas
+                        showlegend=False
+                    )
+                    
+                    # Actualizar ejes para todos los subplots: solo la primera
+                    # columna lleva título del eje Y y omite el del eje X
+                    for i in range(1, filas + 1):
+                        for j in range(1, columnas + 1):
+                            if j == 1:
+                                fig.update_xaxes(title_text="", row=i, col=j, showgrid=False)
+                                fig.update_yaxes(title_text="Valor USD (Millones)", row=i, col=j, showgrid=False)
+                            else:
+                                fig.update_xaxes(title_text="Año", row=i, col=j, showgrid=False)
+                                fig.update_yaxes(title_text="", row=i, col=j, showgrid=False)
+                    
+                    st.plotly_chart(fig, use_container_width=True)
+                    # Leyenda superpuesta sobre el gráfico de Uruguay (segunda fila, segunda columna)
+                    st.markdown(
+                        f"""
+                        <div style='position:relative; width:100%; height:0;'>
+                            <div style='position:absolute; right:-2vw; top:-22vw; z-index:10; background:#23272e; padding:16px 20px 16px 16px; border-radius:10px; box-shadow:0 2px 8px rgba(0,0,0,0.08); min-width:220px;'>
+                                <b style='color:#fff'>{'Instituciones' if visualization_type=='MDBs' else ('Macrosector' if visualization_type=='Sectores' else 'Modalidad')}:</b><br>
+                                {''.join([f"<div style='display:flex;align-items:center;gap:6px;margin-top:8px;'><div style='width:18px;height:18px;background:{color};border-radius:3px;border:1px solid #888;'></div><span style='font-size:15px;color:#fff'>{nombre}</span></div>" for nombre, color in colors.items()])}
                             </div>
-                            """,
-                            unsafe_allow_html=True
-                        )
-                    else:
-                        st.info("No hay datos disponibles para los filtros seleccionados.")
+                        </div>
+                        """,
+                        unsafe_allow_html=True
+                    )
                 else:
-                    st.info("No se encontraron transacciones de tipo 'Outgoing Commitment'.")
+                    st.info("No hay datos disponibles para los filtros seleccionados.")
             else:
-                st.error("No se pudieron cargar los datos IATI. Verifique que el archivo 'BDDGLOBALMERGED_ACTUALIZADO.parquet' esté disponible.")
+                st.info("No se encontraron transacciones de tipo 'Outgoing Commitment'.")
+        else:
+            st.error("No se pudieron cargar los datos IATI. Verifique que el archivo 'BDDGLOBALMERGED_ACTUALIZADO.parquet' esté disponible.")
+
+    elif subpage_active == "Actividades":
+        st.subheader("Actividades")
+        st.markdown("---")
+        # Compromisos por prefijo de iatiidentifier (por ejemplo, todo lo de
+        # una organización), con la misma grilla paginada del Visor BDD
+        render_grid(load_commitments_grid(iati_version), "actividades", page_size=50)
 
 elif pagina == 'Sectores':
     render_sectores()
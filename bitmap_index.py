@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Índice invertido de bitmaps sobre las dimensiones de filtro.
+
+Para cada valor de cada dimensión (fuente, país, macrosector, prefix,
+modalidad...) se guarda un bitmap empaquetado con ``numpy.packbits``:
+un bit por fila, ocho filas por byte. Un filtro se resuelve combinando
+bitmaps con OR (valores de una misma dimensión) y AND (entre dimensiones),
+sin volver a comparar las columnas de texto del frame.
+
+El índice se construye una vez por versión de los datos, junto con el
+dataset que indexa.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+class BitmapIndex:
+    """Bitmaps por valor para las columnas indicadas de un frame.
+
+    Los bitmaps son arreglos ``uint8`` empaquetados y se combinan
+    directamente con ``&``, ``|`` y ``~``; ``positions`` los convierte en
+    posiciones de filas.
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: list[str]):
+        self.n_rows = len(df)
+        self._bitmaps: dict[str, dict] = {}
+        self._flags: dict[str, np.ndarray] = {}
+        for col in columns:
+            if col in df.columns:
+                self._bitmaps[col] = self._build(df[col])
+
+    def _pack(self, mask: np.ndarray) -> np.ndarray:
+        bits = np.packbits(mask)
+        bits.setflags(write=False)
+        return bits
+
+    def _build(self, series: pd.Series) -> dict:
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            codes, uniques = pd.factorize(series, sort=True)
+        # Agrupar las filas por código una sola vez en lugar de comparar la
+        # columna completa contra cada valor
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        bitmaps = {}
+        for i, value in enumerate(uniques):
+            rows = order[bounds[i] : bounds[i + 1]]
+            if len(rows):
+                mask = np.zeros(self.n_rows, dtype=bool)
+                mask[rows] = True
+                bitmaps[value.item() if isinstance(value, np.generic) else value] = self._pack(mask)
+        return bitmaps
+
+    def add_flag(self, name: str, mask) -> None:
+        """Guarda un bitmap precalculado a partir de una máscara booleana."""
+        self._flags[name] = self._pack(np.asarray(mask, dtype=bool))
+
+    def flag(self, name: str) -> np.ndarray:
+        return self._flags[name]
+
+    def none(self) -> np.ndarray:
+        """Bitmap sin filas."""
+        return np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+
+    def isin(self, col: str, values) -> np.ndarray:
+        """OR de los bitmaps de ``values``; los valores ausentes no aportan filas."""
+        if isinstance(values, str) or not np.iterable(values):
+            values = [values]
+        bitmaps = self._bitmaps[col]
+        parts = [bitmaps[v] for v in values if v in bitmaps]
+        if not parts:
+            return self.none()
+        if len(parts) == 1:
+            return parts[0]
+        return np.bitwise_or.reduce(parts)
+
+    def matching(self, col: str, predicate) -> np.ndarray:
+        """OR de los bitmaps cuyos valores cumplen ``predicate``."""
+        return self.isin(col, [v for v in self._bitmaps[col] if predicate(v)])
+
+    def positions(self, bits: np.ndarray, rows: slice | None = None) -> np.ndarray:
+        """Posiciones (ordenadas) de las filas marcadas en ``bits``.
+
+        Con ``rows`` solo se desempaquetan los bytes que cubren ese corte de
+        filas (por ejemplo el rango de años de un frame ordenado por fecha).
+        """
+        if rows is None:
+            return np.flatnonzero(np.unpackbits(bits, count=self.n_rows))
+        start, stop = rows.start or 0, min(rows.stop, self.n_rows)
+        if stop <= start:
+            return np.empty(0, dtype=np.intp)
+        first = start // 8
+        local = np.flatnonzero(np.unpackbits(bits[first : (stop + 7) // 8])) + first * 8
+        return local[(local >= start) & (local < stop)]
+
+    def contains(self, bits: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        """Máscara booleana: si cada fila de ``positions`` está marcada en ``bits``.
+
+        Lee solo los bytes de esas filas, sin desempaquetar el bitmap completo.
+        """
+        positions = np.asarray(positions, dtype=np.intp)
+        # ``packbits`` guarda la primera fila en el bit más significativo
+        return ((bits[positions >> 3] >> (7 - (positions & 7))) & 1).astype(bool)
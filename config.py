@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Opciones de configuración de la aplicación.
+
+Los valores se leen de variables de entorno para poder cambiarlos por
+despliegue sin tocar el código.
+"""
+
+from __future__ import annotations
+
+import os
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    """Interpreta una variable de entorno como booleano."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "si", "sí", "on"}
+
+
+def _env_int(name: str, default: int) -> int:
+    """Interpreta una variable de entorno como entero."""
+    value = os.environ.get(name)
+    try:
+        return int(value) if value is not None else default
+    except ValueError:
+        return default
+
+
+# Guardar los montos como float32 en lugar de float64
+FLOAT32_AMOUNTS = _env_flag("SECTORIAL_FLOAT32_AMOUNTS")
+
+# Motor de consultas de la página de Sectores: "pandas" o "duckdb"
+SECTORES_ENGINE = os.environ.get("SECTORES_ENGINE", "pandas").strip().lower()
+
+# Cantidad de filtros de Sectores cuyas filas se guardan en la caché LRU
+SECTORES_FILTER_CACHE_SIZE = _env_int("SECTORES_FILTER_CACHE_SIZE", 32)
+
+# Nodos por nivel del Sankey de Sectores; el resto se agrupa en "Otros"
+# (0 muestra todos los nodos)
+SECTORES_SANKEY_TOP_K = _env_int("SECTORES_SANKEY_TOP_K", 15)
+
+# Backend de cálculo de Transacciones (Financiadores y Países): "pandas" o "polars"
+TRANSACCIONES_BACKEND = os.environ.get("TRANSACCIONES_BACKEND", "pandas").strip().lower()
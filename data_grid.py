@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Grilla paginada con búsqueda, filtros y orden resueltos en el servidor.
+
+``DataGrid`` se construye una vez por dataset y guarda los códigos de los
+valores distintos de las columnas de búsqueda y filtro y, para cada columna
+por la que se ordena, el orden de las filas (``argsort``, calculado la
+primera vez que se pide). Cada consulta combina máscaras booleanas, recorre
+el orden guardado y devuelve solo las filas de la página visible, que es lo
+único que se envía al navegador.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from prefix_index import PrefixIndex
+
+
+class DataGrid:
+    """Índices de orden, búsqueda y filtro sobre las filas de ``df``.
+
+    ``search`` son las columnas de texto en las que busca ``select``,
+    ``filters`` las columnas que admiten filtros por valor o por rango y
+    ``prefix`` la columna de identificadores con índice de prefijos.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        search: list[str] = (),
+        filters: list[str] = (),
+        prefix: str | None = None,
+    ):
+        self.df = df
+        self.prefix_column = prefix if prefix in df.columns else None
+        self.prefix_index = PrefixIndex(df[prefix]) if self.prefix_column else None
+        self.columns = list(df.columns)
+        self.search_columns = [col for col in search if col in df.columns]
+        self.filter_columns = [col for col in filters if col in df.columns]
+        self._orders = {}
+        # Códigos por fila y valores distintos (en minúsculas para la búsqueda)
+        self._codes = {}
+        for col in set(self.search_columns) | set(self.filter_columns):
+            codes, uniques = pd.factorize(df[col], sort=True)
+            self._codes[col] = (codes, pd.Index(uniques))
+        self._search_values = {
+            col: pd.Series(self._codes[col][1].astype(str)).str.lower()
+            for col in self.search_columns
+        }
+
+    @staticmethod
+    def _order(series: pd.Series) -> tuple[np.ndarray, int]:
+        """Orden ascendente estable con los faltantes al final."""
+        missing = series.isna().to_numpy()
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Orden alfabético de las etiquetas, no de los códigos
+            series = series.astype(str)
+        try:
+            order = np.argsort(series.to_numpy(), kind="stable")
+        except TypeError:
+            order = np.argsort(series.astype(str).to_numpy(), kind="stable")
+        order = np.concatenate([order[~missing[order]], np.flatnonzero(missing)])
+        return order, int((~missing).sum())
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def values(self, col: str) -> list:
+        """Valores distintos (ordenados, sin faltantes) de una columna de filtro."""
+        return list(self._codes[col][1])
+
+    def _mask(self, rows, search: str, filters: dict, prefix: str) -> np.ndarray:
+        if rows is None:
+            mask = np.ones(len(self.df), dtype=bool)
+        else:
+            mask = np.zeros(len(self.df), dtype=bool)
+            mask[np.asarray(rows, dtype=np.int64)] = True
+        prefix = prefix.strip()
+        if prefix and self.prefix_index is not None:
+            found = np.zeros(len(self.df), dtype=bool)
+            found[self.prefix_index.lookup(prefix)] = True
+            mask &= found
+        term = search.strip().lower()
+        if term and self.search_columns:
+            found = np.zeros(len(self.df), dtype=bool)
+            for col in self.search_columns:
+                codes, _ = self._codes[col]
+                hits = self._search_values[col].str.contains(term, regex=False).to_numpy()
+                # Código -1 (faltante) nunca coincide
+                found |= np.append(hits, False)[codes]
+            mask &= found
+        for col, value in filters.items():
+            if isinstance(value, tuple):
+                low, high = value
+                column = self.df[col]
+                mask &= (column.ge(low) & column.le(high)).fillna(False).to_numpy(dtype=bool)
+            elif value:
+                codes, uniques = self._codes[col]
+                wanted = np.append(uniques.isin(list(value)), False)
+                mask &= wanted[codes]
+        return mask
+
+    def select(
+        self,
+        rows=None,
+        search: str = "",
+        filters: dict | None = None,
+        sort_by: str | None = None,
+        ascending: bool = True,
+        prefix: str = "",
+    ) -> np.ndarray:
+        """Posiciones de las filas que cumplen los criterios, ya ordenadas.
+
+        ``rows`` limita la consulta a esas posiciones de ``df`` (por ejemplo
+        las de un filtro de página). ``filters`` es ``{columna: valores}``
+        o ``{columna: (mínimo, máximo)}``; una lista vacía no filtra.
+        ``prefix`` se busca con el índice de prefijos de ``prefix_column``.
+        """
+        mask = self._mask(rows, search, filters or {}, prefix)
+        if sort_by is None:
+            return np.flatnonzero(mask)
+        if sort_by not in self._orders:
+            self._orders[sort_by] = self._order(self.df[sort_by])
+        order, n_valid = self._orders[sort_by]
+        if not ascending:
+            order = np.concatenate([order[:n_valid][::-1], order[n_valid:]])
+        return order[mask[order]]
+
+    def page(self, positions: np.ndarray, page: int, page_size: int) -> pd.DataFrame:
+        """Filas de la página ``page`` (desde 1) de ``positions``."""
+        start = (page - 1) * page_size
+        return self.df.iloc[positions[start : start + page_size]]
+
+
+def render_grid(grid: DataGrid, key: str, rows=None, page_size: int = 10) -> None:
+    """Dibuja la grilla con búsqueda, orden, filtros por columna y paginación."""
+    prefix = ""
+    if grid.prefix_index is not None:
+        prefix = st.text_input(
+            f"Prefijo de {grid.prefix_column}",
+            key=f"{key}_prefijo",
+            placeholder="Por ejemplo XM-DAC-46008",
+        )
+        matches = grid.prefix_index.identifiers(prefix.strip(), limit=11)
+        if prefix.strip():
+            listed = ", ".join(matches[:10]) + (", ..." if len(matches) > 10 else "")
+            st.caption(f"Identificadores: {listed}" if matches else "Sin identificadores con ese prefijo")
+    col_search, col_sort, col_direction = st.columns([3, 2, 1])
+    with col_search:
+        search = st.text_input(
+            "Buscar", key=f"{key}_buscar", help="Busca en: " + ", ".join(grid.search_columns)
+        ) if grid.search_columns else ""
+    with col_sort:
+        sort_by = st.selectbox(
+            "Ordenar por", [None] + grid.columns, key=f"{key}_orden",
+            format_func=lambda col: "Orden original" if col is None else str(col),
+        )
+    with col_direction:
+        descending = st.toggle("Descendente", key=f"{key}_descendente")
+    filters = {}
+    if grid.filter_columns:
+        with st.expander("Filtros por columna"):
+            for col in grid.filter_columns:
+                if pd.api.types.is_numeric_dtype(grid.df[col]) and not isinstance(
+                    grid.df[col].dtype, pd.CategoricalDtype
+                ):
+                    low, high = grid.df[col].min(), grid.df[col].max()
+                    if pd.isna(low):
+                        continue
+                    col_low, col_high = st.columns(2)
+                    low_sel = col_low.number_input(f"{col} mínimo", value=float(low), key=f"{key}_{col}_min")
+                    high_sel = col_high.number_input(f"{col} máximo", value=float(high), key=f"{key}_{col}_max")
+                    if (low_sel, high_sel) != (float(low), float(high)):
+                        filters[col] = (low_sel, high_sel)
+                else:
+                    filters[col] = st.multiselect(col, grid.values(col), key=f"{key}_{col}")
+
+    positions = grid.select(rows, search, filters, sort_by, ascending=not descending, prefix=prefix)
+    total_rows = len(positions)
+    total_pages = max(1, (total_rows - 1) // page_size + 1)
+    # La página guardada puede quedar fuera de rango al cambiar los filtros
+    page_key = f"{key}_pagina"
+    if st.session_state.get(page_key, 1) > total_pages:
+        st.session_state[page_key] = total_pages
+    page = st.number_input(
+        "Página",
+        min_value=1,
+        max_value=total_pages,
+        step=1,
+        key=page_key,
+        help=f"Total de páginas: {total_pages}",
+    )
+    start_idx = (page - 1) * page_size
+    end_idx = start_idx + page_size
+    st.dataframe(grid.page(positions, page, page_size))
+    st.caption(
+        f"Mostrando filas {min(start_idx + 1, total_rows)} a {min(end_idx, total_rows)} de {total_rows}"
+    )
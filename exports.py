@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Exportación de tablas a archivos descargables.
+
+Los archivos se generan recién cuando el usuario pide la descarga (se pasan
+como función a ``st.download_button``) y se escriben por bloques de filas en
+un archivo temporal, sin copias intermedias de la tabla completa: el CSV por
+bloques de texto, el Excel con el modo de solo escritura de openpyxl y Arrow
+IPC por lotes de registros. Solo el archivo terminado se lee a memoria.
+"""
+
+from __future__ import annotations
+
+import tempfile
+from typing import BinaryIO
+
+import pandas as pd
+import pyarrow as pa
+from openpyxl import Workbook
+
+# Filas por bloque al escribir los archivos
+CHUNK_ROWS = 50_000
+
+
+def _chunks(df: pd.DataFrame, chunk_rows: int):
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield start, df.iloc[start : start + chunk_rows]
+
+
+def write_csv(df: pd.DataFrame, out: BinaryIO, chunk_rows: int = CHUNK_ROWS) -> None:
+    """CSV en UTF-8, escrito por bloques de ``chunk_rows`` filas."""
+    for start, chunk in _chunks(df, chunk_rows):
+        out.write(chunk.to_csv(index=False, header=start == 0).encode("utf-8"))
+
+
+def write_excel(df: pd.DataFrame, out: BinaryIO, chunk_rows: int = CHUNK_ROWS) -> None:
+    """Libro de Excel escrito fila a fila (modo de solo escritura)."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append([str(col) for col in df.columns])
+    for _, chunk in _chunks(df, chunk_rows):
+        # Los faltantes van como celdas vacías
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(out)
+
+
+def write_parquet(df: pd.DataFrame, out: BinaryIO, chunk_rows: int = CHUNK_ROWS) -> None:
+    """Archivo Parquet con grupos de ``chunk_rows`` filas."""
+    df.to_parquet(out, index=False, row_group_size=chunk_rows)
+
+
+def write_arrow(df: pd.DataFrame, out: BinaryIO, chunk_rows: int = CHUNK_ROWS) -> None:
+    """Archivo Arrow IPC escrito por lotes de registros."""
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pa.ipc.new_file(out, schema) as writer:
+        for _, chunk in _chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+# Formatos de descarga: extensión, tipo MIME y función de escritura
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv", write_csv),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_excel),
+    "Parquet": ("parquet", "application/vnd.apache.parquet", write_parquet),
+    "Arrow IPC": ("arrow", "application/vnd.apache.arrow.file", write_arrow),
+}
+
+
+def export_file(df: pd.DataFrame, fmt: str) -> bytes:
+    """Contenido de ``df`` en el formato ``fmt``.
+
+    Se escribe en un archivo temporal, que se cierra (y se borra) apenas se
+    lee.
+    """
+    with tempfile.TemporaryFile() as out:
+        EXPORT_FORMATS[fmt][2](df, out)
+        out.seek(0)
+        return out.read()
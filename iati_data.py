@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Lectura y almacenamiento de las transacciones IATI.
+
+Centraliza la lectura de las transacciones para que las páginas solo
+carguen las columnas y filas que realmente utilizan. Las transacciones se
+pueden guardar como un dataset Parquet particionado por año y ``prefix``
+(estilo hive), al que se agregan lotes nuevos reescribiendo solo las
+particiones afectadas::
+
+    python iati_data.py ingest BDDGLOBALMERGED_ACTUALIZADO.parquet
+    python iati_data.py append nuevas_transacciones.parquet
+
+Si el dataset particionado existe, los cargadores lo leen directamente; si
+no, se usa ``BDDGLOBALMERGED_ACTUALIZADO.parquet``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from macrosectores import classify_series
+from schema import IATI_SCHEMA, apply_schema
+from year_index import sort_by_date
+
+IATI_PATH = "BDDGLOBALMERGED_ACTUALIZADO.parquet"
+
+# Dataset particionado (year=.../prefix=...) generado por ``ingest``
+IATI_DATASET_DIR = "iati_dataset"
+PARTITION_COLUMNS = ["year", "prefix"]
+
+# Identificador de cada fila de transacción, usado para deduplicar al agregar
+# lotes (``_link_transaction`` se repite cuando una transacción se reparte
+# entre sectores o países)
+TRANSACTION_KEY = "rowid"
+
+# Tipo de transacción que consumen todas las páginas de IATI
+COMMITMENT_TYPE = "Outgoing Commitment"
+
+# Columnas usadas por las páginas de Transacciones
+IATI_COLUMNS = [
+    "prefix",
+    "iatiidentifier",
+    "transactiontype_codename",
+    "transactiondate_isodate",
+    "sector_code",
+    "sector_codename",
+    "recipientcountry_code",
+    "recipientcountry_codename",
+    "value_usd",
+    "modality",
+]
+
+
+def iati_source() -> str:
+    """Ruta a leer: el dataset particionado si existe, si no el archivo único."""
+    return IATI_DATASET_DIR if os.path.isdir(IATI_DATASET_DIR) else IATI_PATH
+
+
+def _open_dataset(path: str) -> ds.Dataset:
+    """Abre un archivo Parquet o un directorio particionado estilo hive."""
+    if os.path.isdir(path):
+        return ds.dataset(path, format="parquet", partitioning="hive")
+    return ds.dataset(path, format="parquet")
+
+
+def read_iati(
+    path: str | None = None,
+    columns: list[str] | None = None,
+    transaction_type: str | None = COMMITMENT_TYPE,
+    years: tuple[int, int] | None = None,
+) -> pd.DataFrame:
+    """Lee las transacciones IATI proyectando columnas y filtrando en el scan.
+
+    Los filtros se envían a ``pyarrow.dataset``, que descarta los row groups
+    cuyas estadísticas no los cumplen antes de decodificarlos. En el dataset
+    particionado, ``years`` poda directorios ``year=...`` completos.
+    """
+    dataset = _open_dataset(path or iati_source())
+    names = dataset.schema.names
+    columns = [c for c in (columns or IATI_COLUMNS) if c in names]
+    filters = []
+    if transaction_type is not None:
+        filters.append(ds.field("transactiontype_codename") == transaction_type)
+    if years is not None:
+        if "year" in names:
+            filters.append(ds.field("year") >= years[0])
+            filters.append(ds.field("year") <= years[1])
+        else:
+            # Fechas ISO: la comparación de texto respeta el orden cronológico
+            filters.append(ds.field("transactiondate_isodate") >= f"{years[0]}-01-01")
+            filters.append(ds.field("transactiondate_isodate") <= f"{years[1]}-12-31")
+    row_filter = None
+    for condition in filters:
+        row_filter = condition if row_filter is None else row_filter & condition
+    table = dataset.to_table(columns=columns, filter=row_filter)
+    return table.to_pandas()
+
+
+def data_version(path: str | None = None) -> float | None:
+    """Identificador de versión de los datos IATI (última modificación).
+
+    Para el dataset particionado se toma el archivo modificado más
+    recientemente, de modo que agregar un lote invalida la caché.
+    """
+    path = path or iati_source()
+    try:
+        if not os.path.isdir(path):
+            return os.path.getmtime(path)
+        mtimes = [
+            os.path.getmtime(os.path.join(root, name))
+            for root, _, files in os.walk(path)
+            for name in files
+        ]
+        return max(mtimes, default=os.path.getmtime(path))
+    except OSError:
+        return None
+
+
+def _with_partition_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Agrega la columna ``year`` usada para particionar."""
+    out = df.copy()
+    dates = pd.to_datetime(out["transactiondate_isodate"], errors="coerce")
+    out["year"] = dates.dt.year.astype("Int16")
+    return out
+
+
+def _write_partitions(df: pd.DataFrame, root: str) -> None:
+    """Escribe ``df`` reemplazando solo las particiones que contiene."""
+    # Sin metadatos de pandas: los tipos de las particiones los infiere pyarrow
+    table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+    ds.write_dataset(
+        table,
+        root,
+        format="parquet",
+        partitioning=PARTITION_COLUMNS,
+        partitioning_flavor="hive",
+        existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+    )
+
+
+def ingest(source: str, root: str = IATI_DATASET_DIR) -> int:
+    """Crea el dataset particionado a partir de un archivo Parquet completo."""
+    df = _with_partition_columns(pd.read_parquet(source))
+    _write_partitions(df, root)
+    return len(df)
+
+
+def _partition_filter(year, prefix) -> ds.Expression:
+    """Expresión que selecciona la partición ``year=.../prefix=...``."""
+    condition = None
+    for col, value in (("year", year), ("prefix", prefix)):
+        if pd.isna(value):
+            term = ds.field(col).is_null()
+        else:
+            term = ds.field(col) == (int(value) if col == "year" else value)
+        condition = term if condition is None else condition & term
+    return condition
+
+
+def append(batch_path: str, root: str = IATI_DATASET_DIR) -> int:
+    """Agrega un lote de transacciones reescribiendo solo sus particiones.
+
+    Las transacciones del lote reemplazan a las existentes con el mismo
+    ``rowid``, aunque estén en otra partición (por ejemplo si cambió la
+    fecha): se reescriben las particiones del lote y las que pierden filas,
+    y se borran las que quedan vacías. Devuelve la cantidad de particiones
+    reescritas.
+    """
+    batch = _with_partition_columns(pd.read_parquet(batch_path))
+    key = [TRANSACTION_KEY] if TRANSACTION_KEY in batch.columns else None
+    partitions = batch[PARTITION_COLUMNS]
+    existing = []
+    old_files = []
+    if os.path.isdir(root):
+        dataset = _open_dataset(root)
+        if key and TRANSACTION_KEY in dataset.schema.names:
+            # Particiones actuales de los rowid del lote (solo se leen las
+            # columnas de partición de las filas que coinciden)
+            rowids = pa.array(batch[TRANSACTION_KEY].dropna().unique())
+            current = dataset.to_table(
+                columns=PARTITION_COLUMNS, filter=ds.field(TRANSACTION_KEY).isin(rowids)
+            ).to_pandas()
+            partitions = pd.concat([partitions, current.astype(partitions.dtypes.to_dict())])
+        partitions = partitions.drop_duplicates()
+        for year, prefix in partitions.itertuples(index=False):
+            condition = _partition_filter(year, prefix)
+            old_files.append([f.path for f in dataset.get_fragments(filter=condition)])
+            existing.append(dataset.to_table(filter=condition).to_pandas())
+    else:
+        partitions = partitions.drop_duplicates()
+    merged = pd.concat(existing + [batch], ignore_index=True)
+    for col in PARTITION_COLUMNS:
+        merged[col] = merged[col].astype(batch[col].dtype)
+    merged = merged.drop_duplicates(subset=key, keep="last")
+    _write_partitions(merged, root)
+    # Las particiones que quedaron sin filas no se reescriben: se borran
+    remaining = merged[PARTITION_COLUMNS].drop_duplicates()
+    emptied = partitions.merge(remaining, how="left", indicator=True)["_merge"] == "left_only"
+    for paths, is_empty in zip(old_files, emptied):
+        if is_empty:
+            for path in paths:
+                os.remove(path)
+    return len(partitions)
+
+
+def build_commitments(df: pd.DataFrame) -> pd.DataFrame:
+    """Construye la tabla de compromisos usada por la página de Transacciones.
+
+    Deja la fecha tipada, el año como entero, una bandera de monto positivo
+    y el macrosector de cada transacción, de modo que las subpáginas solo
+    tengan que filtrar filas. Las filas quedan ordenadas por fecha para que
+    los rangos de años se resuelvan con ``year_index.YearOffsets``.
+    """
+    out = df
+    if "transactiontype_codename" in out.columns:
+        out = out[out["transactiontype_codename"] == COMMITMENT_TYPE]
+    out = out.copy()
+    out["transactiondate_isodate"] = pd.to_datetime(out["transactiondate_isodate"])
+    # Las transacciones sin fecha nunca pasan el filtro de años
+    out = out[out["transactiondate_isodate"].notna()]
+    out["year"] = out["transactiondate_isodate"].dt.year.astype("int16")
+    out["is_positive"] = out["value_usd"] > 0
+    out["macrosector"] = classify_series(out["sector_codename"], out["sector_code"])
+    out = apply_schema(out, IATI_SCHEMA, "IATI compromisos")
+    return sort_by_date(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dataset IATI particionado por año y prefix")
+    parser.add_argument("command", choices=["ingest", "append"])
+    parser.add_argument("source", help="Archivo Parquet con transacciones IATI")
+    parser.add_argument("--root", default=IATI_DATASET_DIR, help="Directorio del dataset")
+    args = parser.parse_args()
+    if args.command == "ingest":
+        print(f"{ingest(args.source, args.root)} transacciones escritas en {args.root}")
+    else:
+        print(f"{append(args.source, args.root)} particiones reescritas en {args.root}")
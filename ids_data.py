@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Almacén largo para los datos de deuda del IDS.
+
+El archivo ``IDS.parquet`` viene en formato ancho (una columna por país).
+Este módulo lo transforma una sola vez en una tabla larga ordenada por
+país e indicador, de modo que las páginas obtengan cada serie con una
+búsqueda en el índice en lugar de copiar y filtrar el frame completo.
+"""
+
+from __future__ import annotations
+
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Columnas que identifican una serie del IDS
+KEY_COLUMNS = ["SC2", "SC3", "SC4", "Multilateral", "Time"]
+
+# Niveles del índice del almacén largo
+INDEX_LEVELS = ["country"] + KEY_COLUMNS
+
+# Vistas precalculadas del cubo: máximo por las claves indicadas, usando solo
+# las filas que tienen informadas las columnas de ``require``
+IDS_VIEWS = {
+    # Deuda externa: series por SC3
+    "sc3": {"keys": ["country", "SC2", "SC4", "SC3", "Time"], "require": []},
+    # Multilaterales: series por multilateral con SC3 informado
+    "multilateral_sc3": {
+        "keys": ["country", "SC2", "Multilateral", "Time"],
+        "require": ["SC3"],
+    },
+    # Plazos y Tasas y Comprometido: series por multilateral
+    "multilateral": {"keys": ["country", "SC2", "Multilateral", "Time"], "require": []},
+}
+
+
+def country_columns(df: pd.DataFrame) -> list[str]:
+    """Columnas de países del frame ancho (por ejemplo ``"Argentina [ARG]"``)."""
+    return [
+        col
+        for col in df.columns
+        if "[" in col and "]" in col and not col.startswith("PIB") and not col.startswith("%")
+    ]
+
+
+def country_iso(column: str) -> str:
+    """Extrae el código ISO de una columna de país: ``"Brazil [BRA]"`` -> ``"BRA"``."""
+    return column[column.rindex("[") + 1 : column.rindex("]")]
+
+
+def country_labels(df: pd.DataFrame) -> dict[str, str]:
+    """Mapa de la etiqueta de cada columna de país a su código ISO."""
+    return {col: country_iso(col) for col in country_columns(df)}
+
+
+def build_ids_long(df: pd.DataFrame) -> pd.DataFrame:
+    """Convierte el frame ancho del IDS en una tabla larga indexada.
+
+    El resultado tiene una sola columna ``value`` y un ``MultiIndex`` ordenado
+    por (country, SC2, SC3, SC4, Multilateral, Time) con claves categóricas.
+    Las celdas vacías del frame ancho no se incluyen.
+    """
+    labels = country_labels(df)
+    keys = [col for col in KEY_COLUMNS if col in df.columns]
+    long = df[keys + list(labels)].melt(
+        id_vars=keys, var_name="country", value_name="value"
+    )
+    long = long[long["value"].notna()]
+    long["country"] = long["country"].map(labels).astype(
+        pd.CategoricalDtype(categories=sorted(set(labels.values())))
+    )
+    for col in KEY_COLUMNS:
+        if col not in long.columns:
+            long[col] = pd.NA
+    return long.set_index(INDEX_LEVELS).sort_index()
+
+
+def build_ids_cube(ids_long: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """Resuelve los duplicados del almacén largo tomando el valor máximo.
+
+    El cubo tiene un valor por (country, SC2, SC3, SC4, Multilateral, Time).
+    También devuelve un reporte con la cantidad de filas colapsadas.
+    """
+    cube = ids_long.groupby(level=INDEX_LEVELS, observed=True, dropna=False).max()
+    report = {
+        "filas": len(ids_long),
+        "celdas": len(cube),
+        "duplicados": len(ids_long) - len(cube),
+    }
+    logger.info(
+        "IDS: %d filas -> %d celdas (%d duplicados colapsados)",
+        report["filas"],
+        report["celdas"],
+        report["duplicados"],
+    )
+    return cube, report
+
+
+def build_ids_views(cube: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Materializa las vistas de ``IDS_VIEWS`` a partir del cubo."""
+    flat = cube.reset_index()
+    views = {}
+    for name, spec in IDS_VIEWS.items():
+        rows = flat.dropna(subset=spec["require"]) if spec["require"] else flat
+        views[name] = (
+            rows.groupby(spec["keys"], observed=True)["value"].max().to_frame().sort_index()
+        )
+    return views
+
+
+def level_values(ids_long: pd.DataFrame, level: str) -> list:
+    """Valores distintos de un nivel del índice, sin faltantes."""
+    values = ids_long.index.levels[ids_long.index.names.index(level)]
+    return [v for v in values if pd.notna(v)]
+
+
+def select(ids_long: pd.DataFrame, countries, **criteria) -> pd.DataFrame:
+    """Filas del almacén largo para uno o más países.
+
+    ``criteria`` fija valores de otros niveles del índice (por ejemplo
+    ``SC2="Disbursements"``); los criterios con valor ``None`` se ignoran.
+    Devuelve un frame plano con las columnas del índice y ``value``.
+    """
+    if isinstance(countries, str):
+        countries = [countries]
+    criteria = {level: value for level, value in criteria.items() if value is not None}
+    levels = ["country"] + list(criteria)
+    parts = []
+    for iso in countries:
+        key = tuple([iso] + list(criteria.values()))
+        try:
+            parts.append(ids_long.xs(key, level=levels, drop_level=False))
+        except KeyError:
+            continue
+    if not parts:
+        return ids_long.iloc[0:0].reset_index()
+    return pd.concat(parts).reset_index()
+
+
+def view_rows(view: pd.DataFrame, countries, keep: list[str], **criteria) -> pd.DataFrame:
+    """Filas de una vista con un valor por país y por las columnas de ``keep``.
+
+    Si algún criterio se omite (``None``), los valores que quedan repetidos se
+    resuelven con el máximo, igual que en el cubo.
+    """
+    rows = select(view, countries, **criteria)
+    keys = ["country"] + list(keep)
+    if rows.duplicated(keys).any():
+        rows = rows.groupby(keys, observed=True)["value"].max().reset_index()
+    return rows.sort_values(keys, kind="stable").reset_index(drop=True)
+
+
+def country_panels(
+    rows: pd.DataFrame, countries: dict[str, str], labels: list[str], columns: list[str]
+) -> dict[str, pd.DataFrame | None]:
+    """Separa las filas de ``view_rows`` en una tabla por país, en una pasada.
+
+    ``countries`` mapea cada etiqueta a su código ISO (``country_labels``).
+    Devuelve ``{etiqueta: filas}`` en el orden de ``labels``, con ``value``
+    renombrado a la etiqueta y sin filas incompletas; las etiquetas que no
+    existen en el IDS quedan en ``None``.
+    """
+    rows = rows.dropna(subset=list(columns) + ["value"])
+    groups = dict(tuple(rows.groupby("country", observed=True, sort=False)))
+    empty = rows.iloc[0:0]
+    panels = {}
+    for label in labels:
+        if label not in countries:
+            panels[label] = None
+            continue
+        part = groups.get(countries[label], empty)[list(columns) + ["value"]]
+        panels[label] = part.rename(columns={"value": label}).reset_index(drop=True)
+    return panels
@@ -2,16 +2,23 @@
 """Diccionario y utilidades para macro sectores.
 
 Este módulo centraliza el diccionario de macrosectores y
-proporciona una función para identificar el macro sector al que
-pertenece un sector específico. De esta forma el mismo diccionario
-puede reutilizarse en las distintas páginas y gráficos de la
-aplicación.
+proporciona funciones para identificar el macro sector al que
+pertenece un sector específico o cada elemento de una serie de
+sectores. De esta forma el mismo diccionario puede reutilizarse en
+las distintas páginas y gráficos de la aplicación.
 
 Incluye 44 adiciones detectadas como faltantes en la BDD.
+
+Cuando se dispone del código de sector DAC, la clasificación se hace por
+código (excepciones de 5 dígitos y rangos de 3 dígitos) y el nombre queda
+como respaldo.
 """
 
 from __future__ import annotations
 
+import numpy as np
+import pandas as pd
+
 
 def _normalize(name: str) -> str:
     """Normaliza nombres de sectores para coincidencias robustas."""
@@ -141,6 +148,147 @@ _MACRO_LOOKUP = {
 }
 
 
+# ---- CLASIFICACIÓN POR CÓDIGO DAC ----
+# Rangos de categorías DAC de 3 dígitos, expresados como el primer código de
+# 5 dígitos de cada rango. ``None`` marca huecos sin categoría asignada.
+_CODE_RANGES = [
+    (11000, "Social"),  # 110-114 Educación
+    (12000, "Social"),  # 120-123 Salud
+    (13000, "Social"),  # 130 Población y salud reproductiva
+    (14000, "Infraestructura"),  # 140 Agua y saneamiento
+    (15000, "Gobernanza/Público"),  # 150-152 Gobierno y sociedad civil
+    (16000, "Social"),  # 160 Otra infraestructura y servicios sociales
+    (17000, None),
+    (21000, "Infraestructura"),  # 210 Transporte y almacenamiento
+    (22000, "Infraestructura"),  # 220 Comunicaciones
+    (23000, "Infraestructura"),  # 230-236 Energía
+    (24000, "Productivo"),  # 240 Banca y servicios financieros
+    (25000, "Productivo"),  # 250 Empresas y otros servicios
+    (26000, None),
+    (31000, "Productivo"),  # 311-313 Agricultura, silvicultura y pesca
+    (32000, "Productivo"),  # 321-323 Industria, minería y construcción
+    (33000, "Productivo"),  # 331-332 Comercio y turismo
+    (34000, None),
+    (41000, "Ambiental"),  # 410 Protección general del medio ambiente
+    (42000, None),
+    (43000, "Multisectorial/Otros"),  # 430 Otros multisector
+    (44000, None),
+    (51000, "Gobernanza/Público"),  # 510 Apoyo presupuestario general
+    (52000, "Multisectorial/Otros"),  # 520 Asistencia alimentaria
+    (53000, "Multisectorial/Otros"),  # 530 Otra asistencia en bienes
+    (54000, None),
+    (60000, "Gobernanza/Público"),  # 600 Acciones relacionadas con la deuda
+    (61000, None),
+    (72000, "Multisectorial/Otros"),  # 720-740 Ayuda humanitaria
+    (75000, None),
+    (91000, "Multisectorial/Otros"),  # 910 Costos administrativos
+    (92000, None),
+    (93000, "Multisectorial/Otros"),  # 930 Refugiados en países donantes
+    (94000, None),
+    (99800, "Multisectorial/Otros"),  # 998 Sin asignar / no especificado
+    (99900, None),
+]
+
+# Códigos de 5 dígitos cuyo macrosector difiere del de su rango
+_CODE_OVERRIDES = {
+    11100: "Multisectorial/Otros",  # Education, Level Unspecified
+    14010: "Gobernanza/Público",  # Water sector policy and administrative management
+    14015: "Ambiental",  # Water resources conservation (including data collection)
+    14040: "Ambiental",  # River basins development
+    15111: "Infraestructura",  # Public finance management (PFM)
+    15112: "Multisectorial/Otros",  # Decentralisation and support to subnational government
+    15114: "Productivo",  # Domestic revenue mobilisation
+    15125: "Infraestructura",  # Public Procurement
+    15130: "Productivo",  # Legal and judicial development
+    16000: "Multisectorial/Otros",  # Other Social Infrastructure & Services
+    16020: "Infraestructura",  # Employment creation
+    16030: "Infraestructura",  # Housing policy and administrative management
+    16040: "Infraestructura",  # Low-cost housing
+    16050: "Multisectorial/Otros",  # Multisector aid for basic social services
+    22010: "Social",  # Communications policy and administrative management
+    23010: "Productivo",  # Energy policy and administrative management
+    23110: "Productivo",  # Energy policy and administrative management
+    23640: "Productivo",  # Retail gas distribution
+    25020: "Gobernanza/Público",  # Privatisation
+    31161: "Social",  # Food crop production
+    31192: "Multisectorial/Otros",  # Plant and post-harvest protection and pest control
+    32220: "Social",  # Mineral prospection and exploration
+    32261: "Social",  # Coal
+    32262: "Infraestructura",  # Oil and gas (upstream)
+    32310: "Infraestructura",  # Construction policy and administrative management
+    33110: "Infraestructura",  # Trade policy and administrative management
+    33120: "Infraestructura",  # Trade facilitation
+    33181: "Social",  # Trade education/training
+    43030: "Infraestructura",  # Urban development and management
+    43031: "Infraestructura",  # Urban land policy and management
+    43032: "Infraestructura",  # Urban development
+    43040: "Infraestructura",  # Rural development
+    43041: "Infraestructura",  # Rural land policy and management
+    43042: "Infraestructura",  # Rural development
+    43060: "Ambiental",  # Disaster Risk Reduction
+    74010: "Ambiental",  # Disaster prevention and preparedness
+    74020: "Ambiental",  # Multi-hazard response preparedness
+}
+
+# Arreglos ordenados para búsqueda binaria con ``searchsorted``
+_RANGE_BOUNDS = np.array([start for start, _ in _CODE_RANGES], dtype=float)
+_RANGE_LABELS = np.array([macro for _, macro in _CODE_RANGES], dtype=object)
+_OVERRIDE_CODES = np.array(sorted(_CODE_OVERRIDES), dtype=float)
+_OVERRIDE_LABELS = np.array(
+    [_CODE_OVERRIDES[code] for code in sorted(_CODE_OVERRIDES)], dtype=object
+)
+
+
+def classify_codes(codes) -> np.ndarray:
+    """Retorna el macrosector de cada código DAC (``None`` si no se conoce).
+
+    Acepta códigos de 5 dígitos y categorías de 3 dígitos; estas últimas se
+    llevan a 5 dígitos antes de buscarlas en los rangos.
+    """
+    values = pd.to_numeric(pd.Series(codes), errors="coerce").to_numpy(
+        dtype=float, na_value=np.nan
+    )
+    values = np.where(values < 1000, values * 100, values)
+    result = np.full(len(values), None, dtype=object)
+    valid = ~np.isnan(values)
+    found = values[valid]
+    if not len(found):
+        return result
+    idx = np.searchsorted(_RANGE_BOUNDS, found, side="right") - 1
+    labels = np.where(idx >= 0, _RANGE_LABELS[np.clip(idx, 0, None)], None)
+    pos = np.clip(np.searchsorted(_OVERRIDE_CODES, found), 0, len(_OVERRIDE_CODES) - 1)
+    hit = _OVERRIDE_CODES[pos] == found
+    labels = np.where(hit, _OVERRIDE_LABELS[pos], labels)
+    result[valid] = labels
+    return result
+
+
 def get_macrosector(sector_name: str) -> str:
     """Retorna el macrosector correspondiente a un nombre de sector."""
     return _MACRO_LOOKUP.get(_normalize(sector_name), "No clasificado")
+
+
+def classify_series(series: pd.Series, codes=None) -> pd.Series:
+    """Retorna el macrosector de cada elemento de una serie de sectores.
+
+    Solo se normalizan los valores distintos (o las categorías, si la serie es
+    categórica) y el resultado se propaga a las filas mediante sus códigos.
+    Si se entregan ``codes`` (códigos DAC alineados con ``series``), estos
+    tienen prioridad y el nombre solo se usa cuando el código no se conoce.
+    Los valores faltantes quedan como "No clasificado".
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        positions = series.cat.codes.to_numpy()
+        uniques = series.cat.categories
+    else:
+        positions, uniques = pd.factorize(series)
+    # El código -1 (faltante) apunta al último elemento: "No clasificado"
+    labels = np.array(
+        [get_macrosector(str(name)) for name in uniques] + ["No clasificado"],
+        dtype=object,
+    )
+    result = labels[positions]
+    if codes is not None:
+        by_code = classify_codes(codes)
+        result = np.where(pd.isna(by_code), result, by_code)
+    return pd.Series(result, index=series.index, name=series.name)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Índice de prefijos sobre una columna de identificadores.
+
+Los identificadores distintos se guardan en un arreglo ordenado y las filas
+se agrupan por identificador en ese mismo orden. Todos los identificadores
+que empiezan con un prefijo forman un tramo contiguo del arreglo, cuyos
+límites se encuentran con dos búsquedas binarias; las filas de ese tramo
+son a su vez un único corte del arreglo de filas. Una consulta no recorre
+las filas del dataset.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+class PrefixIndex:
+    """Búsqueda por prefijo de ``values`` (por ejemplo ``iatiidentifier``)."""
+
+    def __init__(self, values: pd.Series):
+        codes, uniques = pd.factorize(values.astype(object), sort=True)
+        self.keys = np.asarray([str(v) for v in uniques], dtype=str)
+        # Filas agrupadas por identificador, en el orden de ``keys`` (las
+        # filas sin identificador, código -1, quedan afuera)
+        present = np.flatnonzero(codes >= 0)
+        self._rows = present[np.argsort(codes[present], kind="stable")]
+        self._bounds = np.searchsorted(codes[self._rows], np.arange(len(self.keys) + 1))
+
+    def _range(self, prefix: str) -> tuple[int, int]:
+        """Tramo de ``keys`` con los identificadores que empiezan con ``prefix``."""
+        low = int(np.searchsorted(self.keys, prefix, side="left"))
+        # El primer texto mayor que todos los que empiezan con ``prefix``
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        high = int(np.searchsorted(self.keys, upper, side="left"))
+        return low, high
+
+    def identifiers(self, prefix: str, limit: int | None = None) -> list[str]:
+        """Identificadores distintos que empiezan con ``prefix``, ordenados."""
+        if not prefix:
+            return []
+        low, high = self._range(prefix)
+        if limit is not None:
+            high = min(high, low + limit)
+        return self.keys[low:high].tolist()
+
+    def lookup(self, prefix: str) -> np.ndarray:
+        """Posiciones (ordenadas) de las filas cuyo identificador empieza con ``prefix``."""
+        if not prefix:
+            return np.empty(0, dtype=np.intp)
+        low, high = self._range(prefix)
+        return np.sort(self._rows[self._bounds[low] : self._bounds[high]])
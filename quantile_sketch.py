@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Resúmenes de cuantiles combinables por celda.
+
+Para cada celda (por ejemplo año, fuente, país y macrosector) se guardan los
+montos resumidos en centroides (media y peso), al estilo de un t-digest:
+los centroides son chicos en las colas y más grandes cerca de la mediana.
+Las celdas con pocas filas guardan cada valor como un centroide de peso 1,
+así que sus cuantiles son exactos. Los cuantiles de cualquier conjunto de
+celdas se obtienen juntando sus centroides, sin volver a las filas.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+# Centroides por celda (aproximadamente) y tamaño de celda exacto
+SKETCH_SIZE = 500
+
+
+class QuantileSketches:
+    """Centroides de ``value`` por celda de ``keys``.
+
+    ``cells`` tiene una fila por celda (mismo orden que ``build_cube`` con
+    las mismas claves) y los centroides de la celda ``i`` son
+    ``means[offsets[i]:offsets[i + 1]]`` y ``weights[...]``.
+    """
+
+    def __init__(self, df: pd.DataFrame, keys: list[str], value: str = "value_usd", size: int = SKETCH_SIZE):
+        df = df[df[value].notna()]
+        grouped = df.groupby(list(keys), observed=True, dropna=False, sort=True)
+        cell_ids = grouped.ngroup().to_numpy()
+        first = np.unique(cell_ids, return_index=True)[1]
+        self.cells = df[list(keys)].iloc[first].reset_index(drop=True)
+        values = df[value].to_numpy(dtype=float)
+
+        # Filas ordenadas por celda y monto; rango y tamaño de cada fila en su celda
+        order = np.lexsort((values, cell_ids))
+        cell_ids, values = cell_ids[order], values[order]
+        starts = np.searchsorted(cell_ids, np.arange(len(self.cells) + 1))
+        sizes = np.diff(starts)[cell_ids]
+        ranks = np.arange(len(values)) - starts[cell_ids]
+        # Escala k1 del t-digest: centroides chicos en las colas
+        q = (ranks + 0.5) / sizes
+        scaled = np.floor(size / np.pi * np.arcsin(2 * q - 1)).astype(np.int64)
+        # Las celdas chicas guardan cada valor (los tramos solo se comparan
+        # dentro de cada celda)
+        bucket = np.where(sizes <= size, ranks, scaled)
+        new = np.ones(len(values), dtype=bool)
+        new[1:] = (cell_ids[1:] != cell_ids[:-1]) | (bucket[1:] != bucket[:-1])
+        bounds = np.flatnonzero(new)
+        self.weights = np.diff(np.append(bounds, len(values))).astype(float)
+        self.means = np.add.reduceat(values, bounds) / self.weights if len(values) else values
+        self.offsets = np.searchsorted(bounds, starts)
+
+    def _gather(self, cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Centroides de las celdas ``cells`` (posiciones en ``self.cells``)."""
+        lengths = self.offsets[cells + 1] - self.offsets[cells]
+        total = int(lengths.sum())
+        # Índices de los tramos [offsets[c], offsets[c + 1]) concatenados
+        shift = np.repeat(self.offsets[cells] - np.cumsum(lengths) + lengths, lengths)
+        positions = np.arange(total) + shift
+        return self.means[positions], self.weights[positions]
+
+    def quantiles(self, cells, qs) -> np.ndarray:
+        """Cuantiles ``qs`` de la unión de las celdas ``cells``.
+
+        Interpola linealmente entre los rangos centrales de los centroides,
+        como ``Series.quantile`` (exacto cuando todos los pesos son 1). Sin
+        filas devuelve NaN.
+        """
+        qs = np.atleast_1d(np.asarray(qs, dtype=float))
+        means, weights = self._gather(np.asarray(cells, dtype=np.int64))
+        if not len(means):
+            return np.full(len(qs), np.nan)
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        ends = np.cumsum(weights)
+        centers = ends - (weights + 1) / 2
+        return np.interp(qs * (ends[-1] - 1), centers, means)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Nodos y enlaces de diagramas de Sankey a partir de una tabla agregada.
+
+Cada columna de ``layers`` es un nivel del diagrama. Los nodos salen de los
+códigos de ``pandas.factorize`` y los enlaces entre niveles consecutivos se
+arman concatenando arreglos de códigos, sin recorrer las filas. Opcionalmente
+cada nivel conserva solo sus ``top_k`` nodos de mayor monto y agrupa el resto
+en un nodo "Otros".
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+OTHER = "Otros"
+
+
+def _layer_codes(series: pd.Series, values: np.ndarray, top_k: int, other: str):
+    """Códigos y etiquetas de un nivel, con la cola agrupada en ``other``."""
+    codes, uniques = pd.factorize(series)
+    labels = list(uniques)
+    if top_k <= 0 or len(labels) <= top_k:
+        return codes, labels
+    totals = np.bincount(codes, weights=values, minlength=len(labels))
+    # Los nodos conservados mantienen el orden de aparición
+    keep = np.sort(np.argsort(-totals, kind="stable")[:top_k])
+    remap = np.full(len(labels), top_k)
+    remap[keep] = np.arange(top_k)
+    return remap[codes], [labels[i] for i in keep] + [other]
+
+
+def sankey_links(
+    df: pd.DataFrame,
+    layers: list[str],
+    value: str,
+    top_k: int = 0,
+    other: str = OTHER,
+) -> dict:
+    """Nodos y enlaces del Sankey ``layers[0] -> layers[1] -> ...``.
+
+    Devuelve un diccionario con ``labels`` (etiquetas de todos los nodos),
+    ``layer_labels`` (etiquetas por nivel) y los arreglos ``source``,
+    ``target``, ``value`` y ``group`` de los enlaces. ``group`` es el índice
+    del nodo del primer nivel del que proviene cada enlace (para colorearlo).
+    Los enlaces con los mismos extremos y el mismo grupo se suman en uno
+    solo; con ``top_k`` mayor que 0 cada nivel conserva sus ``top_k`` nodos
+    de mayor monto y el resto pasa a un nodo ``other``.
+    """
+    values = df[value].to_numpy(dtype=float)
+    codes, layer_labels = [], []
+    for col in layers:
+        layer, labels = _layer_codes(df[col], values, top_k, other)
+        codes.append(layer)
+        layer_labels.append(labels)
+    offsets = np.cumsum([0] + [len(labels) for labels in layer_labels])
+    n_nodes = int(offsets[-1])
+
+    group = np.tile(codes[0], len(layers) - 1)
+    source = np.concatenate([codes[i] + offsets[i] for i in range(len(layers) - 1)])
+    target = np.concatenate([codes[i + 1] + offsets[i + 1] for i in range(len(layers) - 1)])
+    weights = np.tile(values, len(layers) - 1)
+
+    # Sumar los enlaces hermanos (mismo grupo y mismos extremos), en el orden
+    # de su primera aparición
+    keys = (group.astype(np.int64) * n_nodes + source) * n_nodes + target
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    merged = np.bincount(inverse.ravel(), weights=weights, minlength=len(first))
+    order = np.argsort(first, kind="stable")
+    first = first[order]
+    return {
+        "labels": [label for labels in layer_labels for label in labels],
+        "layer_labels": layer_labels,
+        "source": source[first],
+        "target": target[first],
+        "value": merged[order],
+        "group": group[first],
+    }
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Esquema compacto de tipos para los conjuntos de datos.
+
+Convierte las columnas de texto repetitivas a categóricas con un orden de
+categorías estable, los años a enteros pequeños y, opcionalmente, los montos
+a ``float32``. Cada conversión deja un reporte de memoria antes y después.
+"""
+
+from __future__ import annotations
+
+import logging
+
+import pandas as pd
+
+from config import FLOAT32_AMOUNTS
+
+logger = logging.getLogger(__name__)
+
+SECTORES_SCHEMA = {
+    "categorical": [
+        "source",
+        "recipientcountry_code",
+        "recipientcountry_codename",
+        "reportingorg_ref",
+        "sector_codename",
+        "macro_sector",
+    ],
+    "year": ["year"],
+    "amount": ["value_usd"],
+}
+
+IATI_SCHEMA = {
+    "categorical": [
+        "prefix",
+        "transactiontype_codename",
+        "sector_codename",
+        "recipientcountry_code",
+        "recipientcountry_codename",
+        "modality",
+        "macrosector",
+    ],
+    "year": ["year"],
+    "amount": ["value_usd"],
+}
+
+IDS_SCHEMA = {
+    "categorical": ["SC2", "SC3", "SC4", "Multilateral"],
+    "year": ["Time"],
+    "amount": [],
+}
+
+# Último reporte de memoria por conjunto de datos
+MEMORY_REPORTS: dict[str, pd.DataFrame] = {}
+
+
+def _as_category(series: pd.Series) -> pd.Series:
+    """Convierte a categórica con categorías ordenadas alfabéticamente."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    categories = sorted(series.dropna().astype(str).unique())
+    return series.astype(pd.CategoricalDtype(categories=categories))
+
+
+def _as_small_year(series: pd.Series) -> pd.Series:
+    """Convierte años a ``int16`` (``Int16`` si hay valores faltantes)."""
+    if series.notna().all():
+        return series.astype("int16")
+    return series.astype("Int16")
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """Compara la memoria por columna (en MB) de dos versiones de un frame."""
+    report = pd.DataFrame(
+        {
+            "antes_mb": before.memory_usage(deep=True, index=False) / 1e6,
+            "despues_mb": after.memory_usage(deep=True, index=False) / 1e6,
+            "dtype": after.dtypes.astype(str),
+        }
+    )
+    report.loc["TOTAL", ["antes_mb", "despues_mb"]] = report[
+        ["antes_mb", "despues_mb"]
+    ].sum()
+    return report
+
+
+def apply_schema(
+    df: pd.DataFrame,
+    schema: dict,
+    name: str,
+    float32_amounts: bool | None = None,
+    amount_columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """Aplica un esquema compacto a ``df`` y registra el reporte de memoria.
+
+    ``amount_columns`` permite agregar columnas de montos que no se conocen de
+    antemano (por ejemplo, las columnas por país del IDS).
+    """
+    if float32_amounts is None:
+        float32_amounts = FLOAT32_AMOUNTS
+    out = df.copy()
+    for col in schema.get("categorical", []):
+        if col in out.columns:
+            out[col] = _as_category(out[col])
+    for col in schema.get("year", []):
+        if col in out.columns:
+            out[col] = _as_small_year(out[col])
+    if float32_amounts:
+        for col in list(schema.get("amount", [])) + list(amount_columns or []):
+            if col in out.columns:
+                out[col] = out[col].astype("float32")
+    report = memory_report(df, out)
+    MEMORY_REPORTS[name] = report
+    logger.info(
+        "%s: %.1f MB -> %.1f MB",
+        name,
+        report.loc["TOTAL", "antes_mb"],
+        report.loc["TOTAL", "despues_mb"],
+    )
+    return out
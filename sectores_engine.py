@@ -0,0 +1,576 @@
+# -*- coding: utf-8 -*-
+"""Motores de consulta para la página de Sectores.
+
+Las subpáginas piden sus agregaciones a un motor en lugar de filtrar y
+agrupar el frame directamente. Hay dos motores con la misma interfaz:
+
+- ``pandas``: cubo de agregados (``aggregate_cube``) para los gráficos;
+  bitmaps por dimensión (``bitmap_index``) y ``groupby`` sobre el frame en
+  memoria cuando hacen falta filas.
+- ``duckdb``: la tabla se copia una vez a una conexión DuckDB en proceso y
+  cada agregación se ejecuta como SQL, con los filtros en el ``WHERE``.
+
+El motor se elige con la variable de entorno ``SECTORES_ENGINE`` (ver
+``config.py``); si DuckDB no está instalado se usa pandas.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from activity_table import ActivityTable
+from aggregate_cube import build_cube, cube_column, rollup, total
+from bitmap_index import BitmapIndex
+from prefix_sums import YearPrefixSums
+from quantile_sketch import QuantileSketches
+from year_index import YearOffsets
+
+try:
+    import duckdb
+except ImportError:  # DuckDB es opcional
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Valor de macro_sector que nunca se muestra en la página
+UNCLASSIFIED = "No clasificado"
+
+# Dimensiones de filtro con bitmaps en el motor pandas (el año se resuelve
+# con la tabla de desplazamientos, porque la tabla está ordenada por fecha)
+INDEX_COLUMNS = ["source", "recipientcountry_code", "recipientcountry_codename", "macro_sector"]
+
+# Claves del cubo de agregados (el nombre del país acompaña a su código)
+CUBE_KEYS = ["year", "source", "recipientcountry_code", "recipientcountry_codename", "macro_sector"]
+
+# Medidas aditivas del cubo que se acumulan por año y funciones que se
+# responden solo con ellas (sin mínimo ni máximo)
+PREFIX_MEASURES = ["sum", "count", "sumsq", "count_iatiidentifier"]
+PREFIX_FUNCS = {"sum", "count", "mean", "var", "std"}
+
+# Medida de actividades distintas, que se responde con la tabla de actividades
+ACTIVITY_COUNT = ("iatiidentifier", "nunique")
+
+# Cuantiles de los montos, que se responden con los resúmenes por celda
+SKETCH_QUANTILES = {"median": 0.5, "p25": 0.25, "p75": 0.75}
+
+# Funciones de agregación admitidas y su equivalente SQL
+_SQL_FUNCS = {
+    "sum": "SUM({col})",
+    "count": "COUNT({col})",
+    "mean": "AVG({col})",
+    "median": "MEDIAN({col})",
+    "p25": "QUANTILE_CONT({col}, 0.25)",
+    "p75": "QUANTILE_CONT({col}, 0.75)",
+    "min": "MIN({col})",
+    "max": "MAX({col})",
+    "nunique": "COUNT(DISTINCT {col})",
+}
+
+
+@dataclass(frozen=True)
+class SectoresFilter:
+    """Filtros comunes de la página de Sectores.
+
+    ``None`` en ``sources``, ``country_codes`` o ``country_names`` significa
+    "sin filtro"; una tupla vacía no deja pasar ninguna fila.
+    """
+
+    year_range: tuple[int, int]
+    sources: tuple | None = None
+    country_codes: tuple | None = None
+    country_names: tuple | None = None
+
+    def key(self) -> tuple:
+        """Clave canónica: el mismo filtro da la misma clave sin importar el orden."""
+
+        def canonical(values):
+            return None if values is None else tuple(sorted({str(v) for v in values}))
+
+        return (
+            tuple(int(year) for year in self.year_range),
+            canonical(self.sources),
+            canonical(self.country_codes),
+            canonical(self.country_names),
+        )
+
+
+def _as_values(value) -> list:
+    """Normaliza un criterio a lista de valores."""
+    if isinstance(value, (list, tuple, set, np.ndarray, pd.Index)):
+        return list(value)
+    return [value]
+
+
+def _totals_from(values: dict, measures: dict) -> dict:
+    """Ajusta totales vacíos: las sumas sin filas valen 0 y el resto NaN."""
+    out = {}
+    for name, (_, func) in measures.items():
+        value = values.get(name)
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            value = 0 if func in ("sum", "count", "nunique") else np.nan
+        out[name] = value
+    return out
+
+
+def _row_func(func: str):
+    """Función de agregación de pandas para ``func`` (los cuantiles no tienen nombre)."""
+    if func in SKETCH_QUANTILES and func != "median":
+        q = SKETCH_QUANTILES[func]
+        return lambda series: series.quantile(q)
+    return func
+
+
+def build_index(df: pd.DataFrame) -> BitmapIndex:
+    """Índice de bitmaps de la tabla de sectores.
+
+    Además de las dimensiones de ``INDEX_COLUMNS`` guarda la bandera
+    ``"base"`` con las filas que la página muestra siempre (monto no
+    negativo y macrosector clasificado).
+    """
+    index = BitmapIndex(df, INDEX_COLUMNS)
+    index.add_flag("base", (df["value_usd"] >= 0) & df["macro_sector"].ne(UNCLASSIFIED))
+    return index
+
+
+def select_rows(index: BitmapIndex, years: YearOffsets, filtro: SectoresFilter) -> np.ndarray:
+    """Posiciones de las filas que cumplen ``filtro``.
+
+    El rango de años es un corte contiguo de la tabla ordenada por fecha;
+    el resto de los filtros se resuelve con bitmaps.
+    """
+    bits = index.flag("base")
+    for col, values in (
+        ("source", filtro.sources),
+        ("recipientcountry_code", filtro.country_codes),
+        ("recipientcountry_codename", filtro.country_names),
+    ):
+        if values is not None:
+            bits = bits & index.isin(col, values)
+    return index.positions(bits, years.slice(*filtro.year_range))
+
+
+class SelectionCache:
+    """Caché LRU acotada de selecciones de filas, con contadores de aciertos.
+
+    Guarda las posiciones de las filas (no copias del frame) por clave
+    canónica de ``SectoresFilter``. Es compartida entre sesiones, por eso
+    las operaciones se hacen bajo un candado. Cada vez que descarta una
+    entrada registra los contadores con ``logger.debug``.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, compute) -> np.ndarray:
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        positions = compute()
+        positions.setflags(write=False)
+        with self._lock:
+            self._entries[key] = positions
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                # Aciertos y fallos acumulados, para dimensionar la caché
+                logger.debug(
+                    "Caché de filtros llena (%d entradas): se descarta la más antigua; "
+                    "%d aciertos, %d fallos",
+                    self.maxsize,
+                    self.hits,
+                    self.misses,
+                )
+        return positions
+
+
+class PandasQuery:
+    """Consulta en memoria para un ``SectoresFilter``.
+
+    Las agregaciones combinables se responden con el cubo del motor, los
+    conteos de actividades distintas con la tabla de actividades y las
+    medianas y cuartiles con los resúmenes de cuantiles. Las filas de la
+    tabla solo se seleccionan (y se guardan en la caché del motor) cuando
+    una consulta las necesita: valores distintos de columnas que no son
+    claves del cubo, rangos de montos o la tabla maestra.
+    """
+
+    def __init__(self, engine: "PandasEngine", filtro: SectoresFilter):
+        self._engine = engine
+        self._filtro = filtro
+        self._rows_cache = None
+        self._positions = None
+        self._cells_cache = {}
+        self._activities_cache = None
+
+    def _filter_cells(self, cells: pd.DataFrame, mask: pd.Series) -> pd.DataFrame:
+        filtro = self._filtro
+        for col, values in (
+            ("source", filtro.sources),
+            ("recipientcountry_code", filtro.country_codes),
+            ("recipientcountry_codename", filtro.country_names),
+        ):
+            if values is not None:
+                mask &= cells[col].isin(values)
+        return cells[mask]
+
+    def _cells(self, by_year: bool = True) -> pd.DataFrame:
+        """Celdas del cubo para el filtro.
+
+        Sin ``by_year`` son los totales del rango de años de cada grupo,
+        obtenidos de las sumas acumuladas (``cum[fin] - cum[inicio - 1]``).
+        """
+        if by_year not in self._cells_cache:
+            engine = self._engine
+            if by_year:
+                cube = engine.cube
+                cells = self._filter_cells(cube, cube["year"].between(*self._filtro.year_range))
+            else:
+                totals = engine.prefix_sums.range_totals(*self._filtro.year_range)
+                cells = self._filter_cells(totals, totals["count"] > 0)
+            self._cells_cache[by_year] = cells
+        return self._cells_cache[by_year]
+
+    def _activities(self, where: dict | None = None) -> pd.DataFrame:
+        """Filas de la tabla de actividades con transacciones en el filtro."""
+        if self._activities_cache is None:
+            activities = self._engine.activities
+            mask = pd.Series(activities.active(*self._filtro.year_range), index=activities.table.index)
+            self._activities_cache = self._filter_cells(activities.table, mask)
+        rows = self._activities_cache
+        for col, value in (where or {}).items():
+            rows = rows[rows[col].isin(_as_values(value))]
+        return rows
+
+    def _plan(self, columns, measures: dict, between: dict | None) -> dict | None:
+        """Reparte ``measures`` entre el cubo, las actividades y los cuantiles.
+
+        Devuelve ``{"cube": ..., "activities": ..., "sketches": ...}`` (cada
+        uno con sus medidas) o ``None`` si alguna medida necesita las filas.
+        """
+        if between or not all(col in CUBE_KEYS for col in columns):
+            return None
+        plan = {"cube": {}, "activities": {}, "sketches": {}}
+        for name, (col, func) in measures.items():
+            if (col, func) == ACTIVITY_COUNT and "year" not in columns:
+                plan["activities"][name] = (col, func)
+            elif col == "value_usd" and func in SKETCH_QUANTILES:
+                plan["sketches"][name] = (col, func)
+            elif cube_column(self._engine.cube, col, func):
+                plan["cube"][name] = (col, func)
+            else:
+                return None
+        return plan
+
+    def _quantiles(self, by: list[str], where: dict | None, measures: dict) -> pd.DataFrame:
+        """Cuantiles de ``measures`` por ``by``, juntando los resúmenes de las celdas."""
+        sketches = self._engine.sketches
+        if "sketches" not in self._cells_cache:
+            mask = sketches.cells["year"].between(*self._filtro.year_range)
+            self._cells_cache["sketches"] = self._filter_cells(sketches.cells, mask)
+        cells = self._cells_cache["sketches"]
+        for col, value in (where or {}).items():
+            cells = cells[cells[col].isin(_as_values(value))]
+        qs = [SKETCH_QUANTILES[func] for _, func in measures.values()]
+        if not by:
+            values = sketches.quantiles(cells.index.to_numpy(), qs)
+            return pd.DataFrame([values], columns=list(measures))
+        grouped = cells.groupby(list(by), observed=True, sort=True)
+        out = grouped.size().reset_index()[list(by)]
+        group_ids = grouped.ngroup().to_numpy()
+        order = np.argsort(group_ids, kind="stable")
+        bounds = np.searchsorted(group_ids[order], np.arange(len(out) + 1))
+        positions = cells.index.to_numpy()[order]
+        values = [sketches.quantiles(positions[bounds[g] : bounds[g + 1]], qs) for g in range(len(out))]
+        return pd.concat([out, pd.DataFrame(values, columns=list(measures), index=out.index)], axis=1)
+
+    @property
+    def _rows(self) -> pd.DataFrame:
+        if self._rows_cache is None:
+            engine, filtro = self._engine, self._filtro
+            self._positions = engine.cache.get(
+                filtro.key(), lambda: select_rows(engine.index, engine.years, filtro)
+            )
+            self._rows_cache = engine.df.iloc[self._positions]
+        return self._rows_cache
+
+    def _from_cube(self, columns, measures: dict | None = None, between: dict | None = None) -> bool:
+        cube = self._engine.cube
+        return (
+            not between
+            and all(col in CUBE_KEYS for col in columns)
+            and all(cube_column(cube, col, func) for col, func in (measures or {}).values())
+        )
+
+    def _cube_subset(self, columns, measures: dict | None = None, where: dict | None = None) -> pd.DataFrame:
+        # Las consultas que no separan por año usan los totales del rango
+        by_year = "year" in columns or any(
+            func not in PREFIX_FUNCS for _, func in (measures or {}).values()
+        )
+        cells = self._cells(by_year)
+        for col, value in (where or {}).items():
+            cells = cells[cells[col].isin(_as_values(value))]
+        return cells
+
+    def _subset(self, where: dict | None = None, between: dict | None = None) -> pd.DataFrame:
+        rows = self._rows
+        mask = None
+        # Los criterios sobre dimensiones indexadas se resuelven con bitmaps
+        bits = None
+        index = self._engine.index
+        for col, value in (where or {}).items():
+            if col in INDEX_COLUMNS:
+                term = index.isin(col, _as_values(value))
+                bits = term if bits is None else bits & term
+                continue
+            values = _as_values(value)
+            term = rows[col] == values[0] if len(values) == 1 else rows[col].isin(values)
+            mask = term if mask is None else mask & term
+        if bits is not None:
+            term = index.contains(bits, self._positions)
+            mask = term if mask is None else mask & term
+        for col, (low, high) in (between or {}).items():
+            term = rows[col].between(low, high)
+            mask = term if mask is None else mask & term
+        return rows if mask is None else rows[mask]
+
+    def rows(self, columns: list[str], where: dict | None = None) -> pd.DataFrame:
+        """Filas filtradas con las columnas pedidas, en el orden original."""
+        return self._subset(where)[columns]
+
+    def positions(self) -> np.ndarray:
+        """Posiciones (ordenadas) de las filas del filtro en la tabla del motor."""
+        self._rows
+        return self._positions
+
+    def distinct(self, col: str, where: dict | None = None) -> list:
+        """Valores distintos (ordenados, sin faltantes) de una columna."""
+        if self._from_cube([col, *(where or {})]):
+            return sorted(self._cube_subset([col, *(where or {})], None, where)[col].dropna().unique())
+        return sorted(self._subset(where)[col].dropna().unique())
+
+    def aggregate(
+        self,
+        by: list[str],
+        measures: dict,
+        where: dict | None = None,
+        between: dict | None = None,
+    ) -> pd.DataFrame:
+        """Agrupa por ``by`` y calcula ``measures`` (``{nombre: (columna, func)}``)."""
+        columns = [*by, *(where or {})]
+        if self._from_cube(columns, measures, between):
+            return rollup(self._cube_subset(columns, measures, where), by, measures)
+        plan = self._plan(columns, measures, between)
+        if plan and by:
+            out = None
+            if plan["cube"]:
+                out = rollup(self._cube_subset(columns, plan["cube"], where), by, plan["cube"])
+            if plan["activities"]:
+                counts = self._engine.activities.count(self._activities(where), by, "_activities")
+                out = counts if out is None else out.merge(counts, on=list(by), how="left")
+                for name in plan["activities"]:
+                    out[name] = out["_activities"].fillna(0).astype(int)
+            if plan["sketches"]:
+                quantiles = self._quantiles(by, where, plan["sketches"])
+                out = quantiles if out is None else out.merge(quantiles, on=list(by), how="left")
+            return out[[*by, *measures]]
+        rows = self._subset(where, between)
+        measures = {name: (col, _row_func(func)) for name, (col, func) in measures.items()}
+        return rows.groupby(by, observed=True).agg(**measures).reset_index()
+
+    def totals(self, measures: dict, where: dict | None = None, between: dict | None = None) -> dict:
+        """Como ``aggregate`` pero sin agrupar: un valor por medida."""
+        columns = list(where or {})
+        if self._from_cube(columns, measures, between):
+            cells = self._cube_subset(columns, measures, where)
+            return _totals_from(total(cells, measures), measures)
+        plan = self._plan(columns, measures, between)
+        if plan:
+            values = {}
+            if plan["cube"]:
+                values.update(total(self._cube_subset(columns, plan["cube"], where), plan["cube"]))
+            if plan["activities"]:
+                n_activities = self._activities(where)[ACTIVITY_COUNT[0]].nunique()
+                values.update({name: n_activities for name in plan["activities"]})
+            if plan["sketches"]:
+                values.update(self._quantiles([], where, plan["sketches"]).iloc[0].to_dict())
+            return _totals_from(values, measures)
+        rows = self._subset(where, between)
+        values = {name: rows[col].agg(_row_func(func)) for name, (col, func) in measures.items()}
+        return _totals_from(values, measures)
+
+
+class PandasEngine:
+    """Motor que evalúa las consultas con pandas.
+
+    Las agregaciones se sirven desde un cubo de sumas, conteos y sumas de
+    cuadrados por (año, fuente, país, macrosector), construido una vez con
+    el motor; las que no separan por año usan sus sumas acumuladas por año
+    (``YearPrefixSums``), de modo que mover el rango de años no recorre
+    celdas año por año. Los conteos de actividades distintas salen de una
+    tabla de actividades (``ActivityTable``) y las medianas y cuartiles de
+    resúmenes de cuantiles por celda (``QuantileSketches``). Cuando hacen
+    falta filas, los filtros se resuelven con el índice de bitmaps y las
+    filas de cada filtro se guardan en una ``SelectionCache``.
+    """
+
+    name = "pandas"
+
+    def __init__(self, df: pd.DataFrame, cache_size: int = 32):
+        self.df = df
+        self.index = build_index(df)
+        self.years = YearOffsets(df["year"])
+        self.cache = SelectionCache(cache_size)
+        base = df.iloc[self.index.positions(self.index.flag("base"))]
+        self.cube = build_cube(base, CUBE_KEYS, count_columns=["iatiidentifier"])
+        self.prefix_sums = YearPrefixSums(self.cube, CUBE_KEYS[1:], PREFIX_MEASURES)
+        self.activities = ActivityTable(base, INDEX_COLUMNS)
+        self.sketches = QuantileSketches(base, CUBE_KEYS)
+
+    def query(self, filtro: SectoresFilter) -> PandasQuery:
+        return PandasQuery(self, filtro)
+
+
+class DuckDBQuery:
+    """Consulta SQL sobre la tabla ``sectores`` de DuckDB para un ``SectoresFilter``."""
+
+    def __init__(self, engine: "DuckDBEngine", filtro: SectoresFilter):
+        self._engine = engine
+        clauses = [
+            '"year" BETWEEN ? AND ?',
+            '"value_usd" >= 0',
+            '"macro_sector" IS DISTINCT FROM ?',
+        ]
+        params = [int(filtro.year_range[0]), int(filtro.year_range[1]), UNCLASSIFIED]
+        for col, values in (
+            ("source", filtro.sources),
+            ("recipientcountry_code", filtro.country_codes),
+            ("recipientcountry_codename", filtro.country_names),
+        ):
+            if values is not None:
+                clause, extra = self._in_clause(col, values)
+                clauses.append(clause)
+                params.extend(extra)
+        self._clauses = clauses
+        self._params = params
+
+    @staticmethod
+    def _in_clause(col: str, values) -> tuple[str, list]:
+        values = _as_values(values)
+        if not values:
+            return "FALSE", []
+        placeholders = ", ".join("?" for _ in values)
+        return f'"{col}" IN ({placeholders})', [str(v) for v in values]
+
+    def _where(self, where: dict | None = None, between: dict | None = None, by=()) -> tuple[str, list]:
+        clauses = list(self._clauses)
+        params = list(self._params)
+        for col, value in (where or {}).items():
+            clause, extra = self._in_clause(col, value)
+            clauses.append(clause)
+            params.extend(extra)
+        for col, (low, high) in (between or {}).items():
+            clauses.append(f'"{col}" BETWEEN ? AND ?')
+            params.extend([float(low), float(high)])
+        # pandas descarta los grupos con clave faltante
+        clauses.extend(f'"{col}" IS NOT NULL' for col in by)
+        return " AND ".join(clauses), params
+
+    def rows(self, columns: list[str], where: dict | None = None) -> pd.DataFrame:
+        condition, params = self._where(where)
+        select = ", ".join(f'"{col}"' for col in columns)
+        sql = f"SELECT _row, {select} FROM sectores WHERE {condition} ORDER BY _row"
+        return self._engine.execute(sql, params).set_index("_row").rename_axis(None)
+
+    def positions(self) -> np.ndarray:
+        condition, params = self._where(None)
+        sql = f"SELECT _row FROM sectores WHERE {condition} ORDER BY _row"
+        return self._engine.execute(sql, params)["_row"].to_numpy()
+
+    def distinct(self, col: str, where: dict | None = None) -> list:
+        condition, params = self._where(where, by=[col])
+        sql = f'SELECT DISTINCT "{col}" FROM sectores WHERE {condition} ORDER BY 1'
+        return self._engine.execute(sql, params)[col].tolist()
+
+    @staticmethod
+    def _select_measures(measures: dict) -> str:
+        return ", ".join(
+            _SQL_FUNCS[func].format(col=f'"{col}"') + f' AS "{name}"'
+            for name, (col, func) in measures.items()
+        )
+
+    def aggregate(
+        self,
+        by: list[str],
+        measures: dict,
+        where: dict | None = None,
+        between: dict | None = None,
+    ) -> pd.DataFrame:
+        condition, params = self._where(where, between, by)
+        keys = ", ".join(f'"{col}"' for col in by)
+        sql = (
+            f"SELECT {keys}, {self._select_measures(measures)} FROM sectores "
+            f"WHERE {condition} GROUP BY {keys} ORDER BY {keys}"
+        )
+        return self._engine.execute(sql, params)
+
+    def totals(self, measures: dict, where: dict | None = None, between: dict | None = None) -> dict:
+        condition, params = self._where(where, between)
+        sql = f"SELECT {self._select_measures(measures)} FROM sectores WHERE {condition}"
+        values = self._engine.execute(sql, params).iloc[0].to_dict()
+        return _totals_from(values, measures)
+
+
+class DuckDBEngine:
+    """Motor que ejecuta las consultas en una conexión DuckDB en proceso."""
+
+    name = "duckdb"
+
+    def __init__(self, df: pd.DataFrame):
+        self._con = duckdb.connect()
+        self._lock = threading.Lock()
+        # Las categóricas se guardan como texto y ``_row`` conserva el orden
+        source = df.assign(_row=np.arange(len(df)))
+        for col in source.columns:
+            if isinstance(source[col].dtype, pd.CategoricalDtype):
+                source[col] = source[col].astype(object)
+        self._con.register("sectores_df", source)
+        self._con.execute("CREATE TABLE sectores AS SELECT * FROM sectores_df")
+        self._con.unregister("sectores_df")
+
+    def execute(self, sql: str, params: list) -> pd.DataFrame:
+        # Un cursor por consulta: la conexión se comparte entre sesiones
+        with self._lock:
+            cursor = self._con.cursor()
+        try:
+            return cursor.execute(sql, params).df()
+        finally:
+            cursor.close()
+
+    def query(self, filtro: SectoresFilter) -> DuckDBQuery:
+        return DuckDBQuery(self, filtro)
+
+
+def create_engine(df: pd.DataFrame, name: str = "pandas", cache_size: int = 32):
+    """Crea el motor ``name`` para ``df`` (pandas si DuckDB no está disponible).
+
+    ``cache_size`` es la cantidad de filtros cuyas filas guarda el motor
+    pandas; DuckDB resuelve los filtros en cada consulta.
+    """
+    if name == "duckdb":
+        if duckdb is not None:
+            return DuckDBEngine(df)
+        logger.warning("DuckDB no está instalado; se usa el motor pandas")
+    return PandasEngine(df, cache_size)
@@ -3,8 +3,16 @@ import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 from pandas.api.types import is_string_dtype
-from io import BytesIO
-from macrosectores import get_macrosector
+from functools import partial
+from config import SECTORES_ENGINE, SECTORES_FILTER_CACHE_SIZE, SECTORES_SANKEY_TOP_K
+from data_grid import DataGrid, render_grid
+from exports import EXPORT_FORMATS, export_file
+from macrosectores import classify_series
+from sankey import sankey_links
+from schema import SECTORES_SCHEMA, apply_schema
+from sectores_engine import SectoresFilter, create_engine
+from shared_data import shared
+from year_index import sort_by_date
 
 # Utilidad para manejar multiselect con opción "Seleccionar todo"
 def handle_multiselect_behavior(selected_options, all_options, select_all_text):
@@ -12,6 +20,18 @@ def handle_multiselect_behavior(selected_options, all_options, select_all_text):
         return all_options
     return [opt for opt in selected_options if opt != select_all_text]
 
+# Columnas de la tabla maestra
+MAESTRA_COLUMNS = [
+    "iatiidentifier",
+    "transactiondate_isodate",
+    "recipientcountry_codename",
+    "source",
+    "macro_sector",
+    "sector_code",
+    "sector_codename",
+    "value_usd",
+]
+
 # Paleta de colores fija para cada macro sector
 MACRO_COLOR_MAP = {
     "Social": "#001524",
@@ -24,23 +44,49 @@ MACRO_COLOR_MAP = {
 }
 
 
-@st.cache_data
+@shared
 def load_sectores() -> pd.DataFrame:
     df = pd.read_parquet("sectores.parquet")
     df["transactiondate_isodate"] = pd.to_datetime(df["transactiondate_isodate"])
+    # Ordenada por fecha: cada rango de años es un bloque contiguo de filas
+    df = sort_by_date(df)
     if is_string_dtype(df["sector_code"]):
         df["sector_code"] = pd.to_numeric(df["sector_code"], errors="coerce")
     df["sector_code"] = df["sector_code"].astype("Int64")
     df["year"] = df["transactiondate_isodate"].dt.year
     df["month"] = df["transactiondate_isodate"].dt.to_period("M").astype(str)
-    df["macro_sector"] = df["sector_codename"].map(get_macrosector)
+    df["macro_sector"] = classify_series(df["sector_codename"], df["sector_code"])
     df.loc[df["sector_codename"].eq("Sectors not specified"), "macro_sector"] = (
         "Administrativo / No asignado"
     )
-    return df
+    return apply_schema(df, SECTORES_SCHEMA, "sectores")
+
+
+@shared
+def load_grid() -> DataGrid:
+    """Grilla de la tabla maestra con sus índices de búsqueda, prefijos, filtro y orden."""
+    return DataGrid(
+        load_sectores()[MAESTRA_COLUMNS],
+        search=["iatiidentifier", "sector_codename"],
+        filters=["recipientcountry_codename", "source", "macro_sector", "sector_codename", "value_usd"],
+        prefix="iatiidentifier",
+    )
+
+
+@shared
+def load_engine(name: str = SECTORES_ENGINE):
+    """Motor de consultas (pandas o DuckDB) sobre la tabla de sectores."""
+    return create_engine(load_sectores(), name, SECTORES_FILTER_CACHE_SIZE)
+
+
+def export_rows(query, fmt: str) -> bytes:
+    """Archivo de descarga de la tabla maestra, armado al hacer clic."""
+    return export_file(query.rows(MAESTRA_COLUMNS), fmt)
+
 
 def render():
     df = load_sectores()
+    engine = load_engine()
     min_year, max_year = int(df["year"].min()), int(df["year"].max())
     source_list = sorted(df["source"].dropna().unique())
     selected_sources = source_list
@@ -112,17 +158,22 @@ def render():
                 "País", country_list_tabla, default=country_list_tabla, key="paises_maestra"
             )
     # Apply filters
-    mask = (df["year"].between(*year_range)) & (df["value_usd"] >= 0)
-    df_f = df[mask].copy()
-    df_f = df_f[df_f["macro_sector"].ne("No clasificado")]
+    filtro = SectoresFilter(tuple(year_range))
     if subpage == "Panorama de sectores" and selected_sources:
-        df_f = df_f[df_f["source"].isin(selected_sources)]
-        df_f = df_f[df_f["recipientcountry_code"].isin(selected_country_codes)]
+        filtro = SectoresFilter(
+            tuple(year_range),
+            sources=tuple(selected_sources),
+            country_codes=tuple(selected_country_codes),
+        )
     elif subpage == "Matrices de concentración" and selected_sources:
-        df_f = df_f[df_f["source"].isin(selected_sources)]
+        filtro = SectoresFilter(tuple(year_range), sources=tuple(selected_sources))
     elif subpage == "Tabla maestra":
-        df_f = df_f[df_f["source"].isin(selected_sources)]
-        df_f = df_f[df_f["recipientcountry_codename"].isin(selected_countries_tabla)]
+        filtro = SectoresFilter(
+            tuple(year_range),
+            sources=tuple(selected_sources),
+            country_names=tuple(selected_countries_tabla),
+        )
+    query = engine.query(filtro)
     top_n = 10
 
     # Mapear los macro sectores presentes a los colores predefinidos para
@@ -130,15 +181,18 @@ def render():
     # criterios.
     macro_color_map = {
         m: MACRO_COLOR_MAP[m]
-        for m in df_f["macro_sector"].dropna().unique()
+        for m in query.distinct("macro_sector")
         if m in MACRO_COLOR_MAP
     }
 
     if subpage == "Panorama de sectores":
         st.title("Panorama de Sectores")
         df_macro = (
-            df_f.groupby("macro_sector")
-            .agg(value_usd=("value_usd", "sum"), ops=("iatiidentifier", "count"))
+            query.aggregate(
+                ["macro_sector"],
+                {"value_usd": ("value_usd", "sum"), "ops": ("iatiidentifier", "nunique")},
+            )
+            .set_index("macro_sector")
             .sort_values("value_usd", ascending=True)
         )
         df_macro["value_usd"] = df_macro["value_usd"] / 1e6
@@ -171,10 +225,10 @@ def render():
             fig_donut.update_traces(hovertemplate="%{label}: %{value:,.2f} millones")
             st.plotly_chart(fig_donut, use_container_width=True)
 
-        df_year_macro = (
-            df_f[df_f["macro_sector"].isin(macro_order)]
-            .groupby(["year", "macro_sector"])["value_usd"].sum()
-            .reset_index()
+        df_year_macro = query.aggregate(
+            ["year", "macro_sector"],
+            {"value_usd": ("value_usd", "sum")},
+            where={"macro_sector": macro_order},
         )
         df_year_macro["value_usd"] = df_year_macro["value_usd"] / 1e6
         df_year_macro["macro_sector"] = pd.Categorical(
@@ -240,11 +294,9 @@ def render():
             st.plotly_chart(fig_percent, use_container_width=True)
 
     elif subpage == "Comparador A vs B":
-        sector_list = sorted(df_f["macro_sector"].dropna().unique())
-        source_list = sorted(df_f["source"].dropna().unique())
-        country_list = sorted(
-            df_f["recipientcountry_codename"].dropna().unique()
-        )
+        sector_list = query.distinct("macro_sector")
+        source_list = query.distinct("source")
+        country_list = query.distinct("recipientcountry_codename")
         col1, col2 = st.columns(2)
         with col1:
             sector_a = st.selectbox("Macro sector A", sector_list, key="sector_a")
@@ -254,18 +306,16 @@ def render():
             sector_b = st.selectbox("Macro sector B", sector_list, key="sector_b")
             source_b = st.selectbox("MDB B", source_list, key="source_b")
             country_b = st.selectbox("País B", country_list, key="country_b")
-        df_a = df_f[
-            (df_f["macro_sector"] == sector_a)
-            & (df_f["source"] == source_a)
-            & (df_f["recipientcountry_codename"] == country_a)
-        ]
-        df_b = df_f[
-            (df_f["macro_sector"] == sector_b)
-            & (df_f["source"] == source_b)
-            & (df_f["recipientcountry_codename"] == country_b)
-        ]
-        df_a = df_a.groupby("year")["value_usd"].sum().reset_index()
-        df_b = df_b.groupby("year")["value_usd"].sum().reset_index()
+        def selection(sector, source, country):
+            return {
+                "macro_sector": sector,
+                "source": source,
+                "recipientcountry_codename": country,
+            }
+
+        year_sum = {"value_usd": ("value_usd", "sum")}
+        df_a = query.aggregate(["year"], year_sum, where=selection(sector_a, source_a, country_a))
+        df_b = query.aggregate(["year"], year_sum, where=selection(sector_b, source_b, country_b))
         df_a["grupo"] = f"{sector_a} - {source_a} - {country_a}"
         df_b["grupo"] = f"{sector_b} - {source_b} - {country_b}"
         comp_df = pd.concat([df_a, df_b])
@@ -300,44 +350,58 @@ def render():
             (col_a, col_b),
             ((sector_a, source_a, country_a), (sector_b, source_b, country_b)),
         ):
-            s_df = df_f[
-                (df_f["macro_sector"] == sector)
-                & (df_f["source"] == source)
-                & (df_f["recipientcountry_codename"] == country)
-            ]
-            total = s_df["value_usd"].sum() / 1e6
-            ops = len(s_df)
+            stats = query.totals(
+                {
+                    "total": ("value_usd", "sum"),
+                    "ops": ("iatiidentifier", "nunique"),
+                    "median": ("value_usd", "median"),
+                    "p25": ("value_usd", "p25"),
+                    "p75": ("value_usd", "p75"),
+                },
+                where=selection(sector, source, country),
+            )
+            total = stats["total"] / 1e6
+            ops = int(stats["ops"])
             ticket = total / ops if ops else 0
-            median = s_df["value_usd"].median() / 1e6 if ops else 0
+            median = stats["median"] / 1e6 if ops else 0
+            p25 = stats["p25"] / 1e6 if ops else 0
+            p75 = stats["p75"] / 1e6 if ops else 0
             col.markdown(
                 f"**{sector} - {source} - {country}**\n\n"
                 f"- Total: {total:,.2f} millones\n"
                 f"- #ops: {ops}\n"
                 f"- Ticket promedio: {ticket:,.2f} millones\n"
-                f"- Mediana: {median:,.2f} millones"
+                f"- Mediana: {median:,.2f} millones\n"
+                f"- P25 / P75: {p25:,.2f} / {p75:,.2f} millones"
             )
 
     elif subpage == "Ficha de sector":
         sector_totals = (
-            df_f.groupby("macro_sector")["value_usd"].sum().sort_values(ascending=False)
+            query.aggregate(["macro_sector"], {"value_usd": ("value_usd", "sum")})
+            .set_index("macro_sector")["value_usd"]
+            .sort_values(ascending=False)
             / 1e6
         )
         default_sector = sector_totals.index[0] if not sector_totals.empty else None
         sector_sel = st.selectbox(
             "Macro sector", sector_totals.index.tolist(), index=0 if default_sector else None
         )
-        sec_df = df_f[df_f["macro_sector"] == sector_sel].copy()
-        sec_df["value_usd"] = sec_df["value_usd"] / 1e6
+        in_sector = {"macro_sector": sector_sel}
+        value_sum = {"value_usd": ("value_usd", "sum")}
         top_countries = (
-            sec_df.groupby("recipientcountry_codename")["value_usd"]
-            .sum()
-            .sort_values(ascending=False)
+            query.aggregate(["recipientcountry_codename"], value_sum, where=in_sector)
+            .sort_values("value_usd", ascending=False)
             .head(top_n)
-            .reset_index()
+            .reset_index(drop=True)
         )
+        top_countries["value_usd"] = top_countries["value_usd"] / 1e6
         top_sources = (
-            sec_df.groupby("source")["value_usd"].sum().sort_values(ascending=False).head(top_n).reset_index()
+            query.aggregate(["source"], value_sum, where=in_sector)
+            .sort_values("value_usd", ascending=False)
+            .head(top_n)
+            .reset_index(drop=True)
         )
+        top_sources["value_usd"] = top_sources["value_usd"] / 1e6
         col_country, col_source = st.columns(2)
         with col_country:
             fig_country = px.bar(
@@ -362,23 +426,34 @@ def render():
 
         st.subheader("Detalle por país")
         focus_codes = ["AR", "BR", "BO", "PY", "UY"]
+        focus_df = query.aggregate(
+            ["recipientcountry_code", "recipientcountry_codename"],
+            {"actividades": ("iatiidentifier", "nunique")},
+            where={**in_sector, "recipientcountry_code": focus_codes},
+        )
         for code in focus_codes:
-            country_df = sec_df[sec_df["recipientcountry_code"] == code]
-            if country_df.empty:
+            country_row = focus_df[focus_df["recipientcountry_code"] == code]
+            if country_row.empty:
                 continue
-            country_name = country_df["recipientcountry_codename"].iloc[0]
-            total_ops = country_df["iatiidentifier"].nunique()
+            country_name = country_row["recipientcountry_codename"].iloc[0]
+            total_ops = int(country_row["actividades"].iloc[0])
             st.markdown(f"### {country_name} ({total_ops} actividades)")
             summary = (
-                country_df.groupby("source")
-                .agg(
-                    actividades=("iatiidentifier", "count"),
-                    ticket_promedio=("value_usd", "mean"),
-                    monto=("value_usd", "sum"),
+                query.aggregate(
+                    ["source"],
+                    {
+                        "actividades": ("iatiidentifier", "nunique"),
+                        "monto": ("value_usd", "sum"),
+                    },
+                    where={**in_sector, "recipientcountry_code": code},
                 )
+                .set_index("source")
                 .sort_values("monto", ascending=False)
                 .head(4)
             )
+            # Ticket promedio por actividad (no por transacción)
+            summary.insert(1, "ticket_promedio", summary["monto"] / summary["actividades"])
+            summary[["ticket_promedio", "monto"]] = summary[["ticket_promedio", "monto"]] / 1e6
             summary = summary.rename(
                 columns={
                     "actividades": "# actividades",
@@ -397,21 +472,20 @@ def render():
     elif subpage == "Matrices de concentración":
         st.title("Matrices de concentración")
         focus_countries = ["AR", "BO", "BR", "PY", "UY"]
-        df_focus = df_f[df_f["recipientcountry_code"].isin(focus_countries)]
+        in_focus = {"recipientcountry_code": focus_countries}
+        value_sum = {"value_usd": ("value_usd", "sum")}
         sector_order = (
-            df_focus.groupby("macro_sector")["value_usd"]
-            .sum()
+            query.aggregate(["macro_sector"], value_sum, where=in_focus)
+            .set_index("macro_sector")["value_usd"]
             .sort_values(ascending=False)
             .index
         )
         pivot = (
-            df_focus.pivot_table(
-                index="macro_sector",
-                columns="recipientcountry_codename",
-                values="value_usd",
-                aggfunc="sum",
-                fill_value=0,
-            )
+            query.aggregate(["macro_sector", "recipientcountry_codename"], value_sum, where=in_focus)
+            .pivot(index="macro_sector", columns="recipientcountry_codename", values="value_usd")
+            .sort_index()
+            .sort_index(axis=1)
+            .fillna(0)
         )
         pivot = pivot.div(pivot.sum(axis=0), axis=1).fillna(0) * 100
         pivot = pivot.loc[sector_order]
@@ -431,13 +505,11 @@ def render():
         st.plotly_chart(fig_heat, use_container_width=True)
 
         pivot2 = (
-            df_focus.pivot_table(
-                index="year",
-                columns="macro_sector",
-                values="value_usd",
-                aggfunc="sum",
-                fill_value=0,
-            )
+            query.aggregate(["year", "macro_sector"], value_sum, where=in_focus)
+            .pivot(index="year", columns="macro_sector", values="value_usd")
+            .sort_index()
+            .sort_index(axis=1)
+            .fillna(0)
         )
         pivot2 = pivot2.div(pivot2.sum(axis=1), axis=0).fillna(0) * 100
         pivot2 = pivot2.T
@@ -459,12 +531,14 @@ def render():
 
     elif subpage == "Intensidad y estructura":
         allowed_codes = ["AR", "BO", "BR", "PY", "UY"]
-        df_base = df_f[df_f["recipientcountry_code"].isin(allowed_codes)]
-        source_opts = sorted(df_base["source"].dropna().unique())
-        country_map = (
-            df_base[["recipientcountry_code", "recipientcountry_codename"]]
-            .drop_duplicates()
-            .set_index("recipientcountry_code")["recipientcountry_codename"]
+        in_base = {"recipientcountry_code": allowed_codes}
+        source_opts = query.distinct("source", where=in_base)
+        country_map = dict(
+            query.aggregate(
+                ["recipientcountry_code", "recipientcountry_codename"],
+                {"ops": ("value_usd", "count")},
+                where=in_base,
+            )[["recipientcountry_code", "recipientcountry_codename"]].itertuples(index=False)
         )
         country_opts = [country_map[c] for c in allowed_codes if c in country_map]
         col_filters = st.columns(2)
@@ -482,10 +556,6 @@ def render():
                 default=country_opts[:1],
             )
             selected_countries = country_sel
-        df_focus = df_base[
-            df_base["source"].isin(selected_sources)
-            & df_base["recipientcountry_codename"].isin(selected_countries)
-        ]
         group_cols = ["macro_sector"]
         symbol_col = None
         if len(selected_sources) > 1 and len(selected_countries) > 1:
@@ -497,16 +567,26 @@ def render():
         elif len(selected_countries) > 1:
             group_cols.append("recipientcountry_codename")
             symbol_col = "recipientcountry_codename"
-        bubble_df = (
-            df_focus.groupby(group_cols).agg(
-                sum_usd=("value_usd", lambda x: x.sum() / 1e6),
-                mean_usd=("value_usd", lambda x: x.mean() / 1e6),
-                ops=("iatiidentifier", "count"),
-            )
-        ).reset_index()
+        bubble_df = query.aggregate(
+            group_cols,
+            {
+                "sum_usd": ("value_usd", "sum"),
+                "ops": ("iatiidentifier", "nunique"),
+            },
+            where={
+                **in_base,
+                "source": selected_sources,
+                "recipientcountry_codename": selected_countries,
+            },
+        )
+        bubble_df["sum_usd"] = bubble_df["sum_usd"] / 1e6
+        # Ticket promedio por actividad
+        bubble_df.insert(len(group_cols) + 1, "mean_usd", bubble_df["sum_usd"] / bubble_df["ops"])
         if symbol_col == "grupo":
             bubble_df["grupo"] = (
-                bubble_df["source"] + " - " + bubble_df["recipientcountry_codename"]
+                bubble_df["source"].astype(str)
+                + " - "
+                + bubble_df["recipientcountry_codename"].astype(str)
             )
         symbol_map = None
         if symbol_col:
@@ -547,10 +627,18 @@ def render():
         # "MDBs" y "Países" seleccionados arriba, por lo que se construye a
         # partir de la base completa de datos filtrada solo por el rango de
         # años y países permitidos.
-        sankey_base = df_base.copy()
-        if not sankey_base.empty:
-            min_val = float(sankey_base["value_usd"].min() / 1e6)
-            max_val = float(sankey_base["value_usd"].max() / 1e6)
+        value_range = query.totals(
+            {
+                "ops": ("value_usd", "count"),
+                "min": ("value_usd", "min"),
+                "max": ("value_usd", "max"),
+            },
+            where=in_base,
+        )
+        sankey_between = None
+        if value_range["ops"]:
+            min_val = float(value_range["min"] / 1e6)
+            max_val = float(value_range["max"] / 1e6)
             col_range = st.columns(2)
             with col_range[0]:
                 min_select = st.number_input(
@@ -569,26 +657,20 @@ def render():
             if min_select > max_select:
                 st.warning("El monto mínimo no puede ser mayor que el máximo")
             else:
-                sankey_base = sankey_base[
-                    sankey_base["value_usd"].between(
-                        min_select * 1e6, max_select * 1e6
-                    )
-                ]
-        sankey_df = (
-            sankey_base.groupby(
-                ["source", "macro_sector", "recipientcountry_codename"]
-            )["value_usd"]
-            .sum()
-            .reset_index()
+                sankey_between = {"value_usd": (min_select * 1e6, max_select * 1e6)}
+        sankey_df = query.aggregate(
+            ["source", "macro_sector", "recipientcountry_codename"],
+            {"value_usd": ("value_usd", "sum")},
+            where=in_base,
+            between=sankey_between,
         )
         sankey_df["value_usd"] = sankey_df["value_usd"] / 1e6
-        sources_nodes = sankey_df["source"].unique().tolist()
-        macro_nodes = sankey_df["macro_sector"].unique().tolist()
-        country_nodes = sankey_df["recipientcountry_codename"].unique().tolist()
-        nodes = sources_nodes + macro_nodes + country_nodes
-        node_indices = {name: i for i, name in enumerate(nodes)}
-        link_colors = []
-        links = {"source": [], "target": [], "value": [], "color": link_colors}
+        sankey = sankey_links(
+            sankey_df,
+            ["source", "macro_sector", "recipientcountry_codename"],
+            "value_usd",
+            top_k=SECTORES_SANKEY_TOP_K,
+        )
         source_palette = px.colors.qualitative.Plotly
         custom_colors = {
             "FONPLATA": "#c1121f",
@@ -596,22 +678,18 @@ def render():
             "WorldBank": "#1b4965",
             "CAF": "#38b000",
         }
-        source_color_map = {
-            s: custom_colors.get(s, source_palette[i % len(source_palette)])
-            for i, s in enumerate(sources_nodes)
+        # Color de cada enlace según la fuente de la que proviene
+        source_colors = [
+            custom_colors.get(s, source_palette[i % len(source_palette)])
+            for i, s in enumerate(sankey["layer_labels"][0])
+        ]
+        links = {
+            "source": sankey["source"],
+            "target": sankey["target"],
+            "value": sankey["value"],
+            "color": [source_colors[i] for i in sankey["group"]],
         }
-        for row in sankey_df.itertuples():
-            color = source_color_map[row.source]
-            links["source"].append(node_indices[row.source])
-            links["target"].append(node_indices[row.macro_sector])
-            links["value"].append(row.value_usd)
-            link_colors.append(color)
-        for row in sankey_df.itertuples():
-            color = source_color_map[row.source]
-            links["source"].append(node_indices[row.macro_sector])
-            links["target"].append(node_indices[row.recipientcountry_codename])
-            links["value"].append(row.value_usd)
-            link_colors.append(color)
+        nodes = sankey["labels"]
         fig_sankey = go.Figure(
             go.Sankey(
                 node=dict(label=nodes),
@@ -627,21 +705,17 @@ def render():
         st.plotly_chart(fig_sankey, use_container_width=True)
 
     elif subpage == "Tabla maestra":
-        cols = [
-            "iatiidentifier",
-            "transactiondate_isodate",
-            "recipientcountry_codename",
-            "source",
-            "macro_sector",
-            "sector_code",
-            "sector_codename",
-            "value_usd",
-        ]
-        st.dataframe(df_f[cols])
-        csv = df_f[cols].to_csv(index=False).encode("utf-8")
-        st.download_button("Descargar CSV", csv, file_name="sectores.csv", mime="text/csv")
-        excel = BytesIO()
-        df_f[cols].to_excel(excel, index=False)
-        st.download_button(
-            "Descargar Excel", excel.getvalue(), file_name="sectores.xlsx", mime="application/vnd.ms-excel"
-        )
+        # Solo la página visible se envía al navegador
+        render_grid(load_grid(), "maestra", rows=query.positions(), page_size=50)
+        # Los archivos se generan solo al hacer clic en cada botón
+        for col, (fmt, (extension, mime, _)) in zip(
+            st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS.items()
+        ):
+            with col:
+                st.download_button(
+                    f"Descargar {fmt}",
+                    partial(export_rows, query, fmt),
+                    file_name=f"sectores.{extension}",
+                    mime=mime,
+                    on_click="ignore",
+                )
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Conjuntos de datos compartidos entre sesiones.
+
+Los datasets base se cargan una sola vez por proceso con
+``st.cache_resource`` (sin serializar ni copiar en cada rerun) y cada
+llamada recibe una vista *copy-on-write*: comparte la memoria del original y
+cualquier modificación crea una copia privada, de modo que ninguna página
+puede alterar los datos de otra sesión. Las vistas requieren el modo
+copy-on-write de pandas, que activa ``app.py`` al iniciar; sin él, ``view``
+entrega copias completas.
+"""
+
+from __future__ import annotations
+
+import functools
+
+import pandas as pd
+import streamlit as st
+
+def view(obj):
+    """Vista de solo lectura de un frame compartido (o de una colección de frames).
+
+    Con copy-on-write la vista no copia datos hasta que se modifica; sin ese
+    modo una vista escribiría sobre el original, así que se copia entero.
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return obj.copy(deep=not pd.get_option("mode.copy_on_write"))
+    if isinstance(obj, tuple):
+        return tuple(view(item) for item in obj)
+    if isinstance(obj, dict):
+        return {key: view(value) for key, value in obj.items()}
+    return obj
+
+
+def shared(loader=None, *, max_entries: int | None = None):
+    """Decorador para cargadores: un resultado por proceso, una vista por llamada.
+
+    ``max_entries`` limita los resultados guardados; los cargadores que
+    reciben la versión de los datos usan ``@shared(max_entries=1)`` para que
+    una versión nueva reemplace a la anterior en lugar de sumarse.
+    """
+    if loader is None:
+        return functools.partial(shared, max_entries=max_entries)
+    cached = st.cache_resource(show_spinner=False, max_entries=max_entries)(loader)
+
+    @functools.wraps(loader)
+    def wrapper(*args, **kwargs):
+        return view(cached(*args, **kwargs))
+
+    wrapper.clear = cached.clear
+    return wrapper
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Construcción de gráficos de paneles múltiples (*small multiples*).
+
+Las series de todos los paneles se separan en una sola pasada sobre la
+tabla agregada (un ordenamiento y un corte por grupo), en lugar de filtrar
+la tabla una vez por panel y por categoría. La grilla se calcula a partir
+de la cantidad de paneles.
+"""
+
+from __future__ import annotations
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def grid_shape(n_panels: int, cols: int = 3) -> tuple[int, int]:
+    """Filas y columnas de la grilla para ``n_panels`` paneles."""
+    cols = max(1, min(cols, n_panels))
+    return max(1, math.ceil(n_panels / cols)), cols
+
+
+def grid_positions(n_panels: int, cols: int = 3) -> list[tuple[int, int]]:
+    """Posición (fila, columna), empezando en 1, de cada panel."""
+    _, cols = grid_shape(n_panels, cols)
+    return [(i // cols + 1, i % cols + 1) for i in range(n_panels)]
+
+
+def facet_traces(
+    data: pd.DataFrame,
+    facet: str,
+    category: str,
+    x: str,
+    y: str,
+    facets: list,
+    categories: list,
+) -> dict:
+    """Series listas para graficar, por panel y categoría.
+
+    Devuelve ``{panel: [(categoría, valores_x, valores_y), ...]}`` con los
+    paneles en el orden de ``facets`` y las categorías en el orden de
+    ``categories``; solo se incluyen las combinaciones con datos. Dentro de
+    cada serie los puntos quedan ordenados por ``x``.
+    """
+    facet_codes = pd.Categorical(data[facet], categories=list(facets)).codes
+    category_codes = pd.Categorical(data[category], categories=list(categories)).codes
+    keep = (facet_codes >= 0) & (category_codes >= 0)
+    facet_codes, category_codes = facet_codes[keep], category_codes[keep]
+    x_values = data[x].to_numpy()[keep]
+    y_values = data[y].to_numpy()[keep]
+
+    order = np.lexsort((x_values, category_codes, facet_codes))
+    keys = facet_codes[order].astype(np.int64) * len(categories) + category_codes[order]
+    groups, starts = np.unique(keys, return_index=True)
+    x_parts = np.split(x_values[order], starts[1:])
+    y_parts = np.split(y_values[order], starts[1:])
+
+    traces = {panel: [] for panel in facets}
+    for key, x_part, y_part in zip(groups, x_parts, y_parts):
+        panel, cat = divmod(int(key), len(categories))
+        traces[facets[panel]].append((categories[cat], x_part, y_part))
+    return traces
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""Backends de cálculo para las subpáginas de Transacciones.
+
+Las subpáginas Financiadores y Países aplican una cadena de filtros sobre la
+tabla de compromisos y terminan en una suma anual por categoría. Hay dos
+backends con la misma interfaz:
+
+- ``pandas``: los filtros se resuelven con un índice de bitmaps
+  (``bitmap_index``) y solo las filas seleccionadas se agrupan con pandas.
+- ``polars``: cada cadena se expresa como un único plan *lazy*; Polars poda
+  columnas y filtros antes de ejecutar en varios hilos y solo el agregado
+  final se convierte a pandas para Plotly.
+
+El backend se elige con la variable de entorno ``TRANSACCIONES_BACKEND``
+(ver ``config.py``); si Polars no está instalado se usa pandas.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from aggregate_cube import build_cube
+from bitmap_index import BitmapIndex
+from prefix_sums import YearPrefixSums
+from year_index import YearOffsets
+
+try:
+    import polars as pl
+except ImportError:  # Polars es opcional
+    pl = None
+
+logger = logging.getLogger(__name__)
+
+# Columnas que usan las subpáginas de Transacciones
+PIPELINE_COLUMNS = [
+    "year",
+    "is_positive",
+    "prefix",
+    "modality",
+    "macrosector",
+    "recipientcountry_code",
+    "recipientcountry_codename",
+    "value_usd",
+]
+
+# Columna de categoría de cada vista de la subpágina Países
+CATEGORY_COLUMNS = {"MDBs": "prefix", "Sectores": "macrosector", "Modalidad": "modality"}
+
+# Instituciones que se grafican
+INSTITUCIONES = ["fonplata", "iadb", "caf", "worldbank"]
+
+# Países de la vista "Países", en el orden de los paneles, con su título
+PAISES_TRANSACCIONES = {
+    "AR": "Argentina",
+    "BO": "Bolivia",
+    "BR": "Brasil",
+    "PY": "Paraguay",
+    "UY": "Uruguay",
+}
+
+# Dimensiones de filtro con bitmaps en el backend pandas (el año se resuelve
+# con la tabla de desplazamientos de la tabla ordenada por fecha)
+INDEX_COLUMNS = [
+    "prefix",
+    "modality",
+    "macrosector",
+    "recipientcountry_code",
+    "recipientcountry_codename",
+]
+
+# Grupos con sumas acumuladas por año (montos positivos)
+PREFIX_GROUP_KEYS = ["prefix", "modality", "recipientcountry_code", "recipientcountry_codename"]
+
+
+def _is_other(value) -> bool:
+    return "other" in str(value).lower()
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """Filtros de la subpágina Financiadores.
+
+    El sidebar arma un ``FilterSpec`` por rerun; el backend lo compila en
+    una selección de filas (``compile``) de la que salen los gráficos, y las
+    opciones de cada widget salen de la selección del filtro armado hasta
+    ese widget. ``None`` significa "sin filtro".
+    """
+
+    years: tuple[int, int]
+    region: tuple[str, ...] | None = None
+    countries: tuple[str, ...] | None = None
+    modality: str | None = None
+    macrosector: str | None = None
+    prefixes: tuple[str, ...] = tuple(INSTITUCIONES)
+
+    def terms(self) -> list[tuple[str, tuple]]:
+        """Condiciones ``columna in valores`` del filtro (además de los años).
+
+        Todos los backends y caminos de cálculo filtran con estas mismas
+        condiciones.
+        """
+        terms = [("prefix", tuple(self.prefixes))]
+        if self.region is not None:
+            terms.append(("recipientcountry_codename", tuple(self.region)))
+        if self.countries:
+            terms.append(("recipientcountry_codename", tuple(self.countries)))
+        if self.modality is not None:
+            terms.append(("modality", (self.modality,)))
+        if self.macrosector is not None:
+            terms.append(("macrosector", (self.macrosector,)))
+        return terms
+
+
+class PandasBackend:
+    """Backend que filtra con un índice de bitmaps y agrupa con pandas.
+
+    Las series anuales cuyos filtros son todos claves de
+    ``PREFIX_GROUP_KEYS`` se leen de las sumas acumuladas por año de esos
+    grupos, sin recorrer transacciones; el resto usa el índice de bitmaps.
+    """
+
+    name = "pandas"
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.index = BitmapIndex(df, INDEX_COLUMNS)
+        self.index.add_flag("positive", df["is_positive"])
+        self.years = YearOffsets(df["year"])
+        # Códigos por fila de cada dimensión, para las opciones de los widgets
+        self._codes = {col: pd.factorize(df[col], sort=True) for col in INDEX_COLUMNS if col in df.columns}
+        positive = df.iloc[self.index.positions(self.index.flag("positive"))]
+        cube = build_cube(positive, ["year", *PREFIX_GROUP_KEYS])
+        self.prefix_sums = YearPrefixSums(cube, PREFIX_GROUP_KEYS, ["sum", "count"])
+
+    def _without_other(self, col: str):
+        # Las filas sin valor se conservan, como con ``str.contains(na=False)``
+        return ~self.index.matching(col, _is_other)
+
+    def _rows(self, bits, years: tuple[int, int]) -> pd.DataFrame:
+        positions = self.index.positions(bits, self.years.slice(years[0], years[1]))
+        return self.df.iloc[positions]
+
+    def _yearly_cells(self, years: tuple[int, int], without_other: str) -> pd.DataFrame:
+        """Montos positivos por grupo y año del rango, sin valores "Other"."""
+        cells = self.prefix_sums.yearly(years[0], years[1])
+        cells = cells[~cells[without_other].str.contains("other", case=False, na=False)]
+        return cells.rename(columns={"sum": "value_usd"})
+
+    def options(self, spec: FilterSpec, col: str) -> list:
+        """Valores (ordenados) de ``col`` en las filas que cumplen ``spec``."""
+        codes, uniques = self._codes[col]
+        codes = codes[self.compile(spec)]
+        return list(uniques[np.unique(codes[codes >= 0])])
+
+    def compile(self, spec: FilterSpec):
+        """Posiciones de las filas que cumplen ``spec`` (una sola máscara de bitmaps)."""
+        index = self.index
+        bits = index.flag("positive") & self._without_other("modality")
+        for col, values in spec.terms():
+            bits &= index.isin(col, values)
+        return index.positions(bits, self.years.slice(spec.years[0], spec.years[1]))
+
+    def financiadores(self, spec: FilterSpec) -> pd.DataFrame:
+        """Suma anual por institución (``year``, ``prefix``, ``value_usd``)."""
+        terms = spec.terms()
+        if all(col in PREFIX_GROUP_KEYS for col, _ in terms):
+            # Las mismas condiciones de ``compile`` sobre las celdas de sumas
+            # acumuladas (que ya son solo montos positivos)
+            cells = self._yearly_cells(spec.years, "modality")
+            mask = np.ones(len(cells), dtype=bool)
+            for col, values in terms:
+                mask &= cells[col].isin(values).to_numpy()
+            cells = cells[mask]
+            return cells.groupby(["year", "prefix"], observed=True)["value_usd"].sum().reset_index()
+        df = self.df.iloc[self.compile(spec)]
+        return df.groupby(["year", "prefix"], observed=True)["value_usd"].sum().reset_index()
+
+    def paises(self, years: tuple[int, int], country_codes: list[str], vista: str) -> pd.DataFrame:
+        """Suma anual por país y categoría de la vista (MDBs, Sectores o Modalidad)."""
+        category = CATEGORY_COLUMNS[vista]
+        keys = ["recipientcountry_code", "year", category]
+        if category in PREFIX_GROUP_KEYS:
+            cells = self._yearly_cells(years, category)
+            mask = cells["recipientcountry_code"].isin(country_codes)
+            if vista == "MDBs":
+                mask &= cells["prefix"].isin(INSTITUCIONES)
+            cells = cells[mask]
+            return cells.groupby(keys, observed=True)["value_usd"].sum().reset_index()
+        index = self.index
+        bits = index.flag("positive") & index.isin("recipientcountry_code", country_codes)
+        if vista == "MDBs":
+            bits &= index.isin("prefix", INSTITUCIONES)
+        elif vista == "Sectores":
+            bits &= ~index.isin("macrosector", "No clasificado")
+        bits &= self._without_other(category)
+        df = self._rows(bits, years)
+        return df.groupby(keys, observed=True)["value_usd"].sum().reset_index()
+
+
+class PolarsBackend:
+    """Backend que arma un plan lazy de Polars por consulta."""
+
+    name = "polars"
+
+    def __init__(self, df: pd.DataFrame):
+        frame = pl.from_pandas(df[[c for c in PIPELINE_COLUMNS if c in df.columns]])
+        # Las categóricas de pandas se comparan como texto; la tabla viene
+        # ordenada por fecha, y por lo tanto por año
+        self._frame = frame.with_columns(
+            pl.col(pl.Categorical, pl.Enum).cast(pl.String),
+            pl.col("year").set_sorted(),
+        )
+
+    @staticmethod
+    def _without_other(col: str):
+        return ~pl.col(col).str.contains("(?i)other").fill_null(False)
+
+    @staticmethod
+    def _to_pandas(lazy, keys: list[str]) -> pd.DataFrame:
+        return lazy.sort(keys).collect().to_pandas()
+
+    def options(self, spec: FilterSpec, col: str) -> list:
+        values = (
+            self.compile(spec)
+            .filter(pl.col(col).is_not_null())
+            .select(pl.col(col).unique())
+            .collect()
+        )
+        return sorted(values[col].to_list())
+
+    def compile(self, spec: FilterSpec):
+        """Plan lazy con todos los filtros de ``spec``."""
+        conditions = [
+            pl.col("year").is_between(spec.years[0], spec.years[1]),
+            pl.col("is_positive"),
+            self._without_other("modality"),
+        ]
+        conditions += [pl.col(col).is_in(list(values)) for col, values in spec.terms()]
+        return self._frame.lazy().filter(*conditions)
+
+    def financiadores(self, spec: FilterSpec) -> pd.DataFrame:
+        keys = ["year", "prefix"]
+        return self._to_pandas(self.compile(spec).group_by(keys).agg(pl.col("value_usd").sum()), keys)
+
+    def paises(self, years: tuple[int, int], country_codes: list[str], vista: str) -> pd.DataFrame:
+        category = CATEGORY_COLUMNS[vista]
+        lazy = self._frame.lazy().filter(
+            pl.col("year").is_between(years[0], years[1]),
+            pl.col("recipientcountry_code").is_in(country_codes),
+            pl.col("is_positive"),
+            self._without_other(category),
+            pl.col(category).is_not_null(),
+        )
+        if vista == "MDBs":
+            lazy = lazy.filter(pl.col("prefix").is_in(INSTITUCIONES))
+        elif vista == "Sectores":
+            lazy = lazy.filter(pl.col("macrosector") != "No clasificado")
+        keys = ["recipientcountry_code", "year", category]
+        return self._to_pandas(lazy.group_by(keys).agg(pl.col("value_usd").sum()), keys)
+
+
+def create_backend(df: pd.DataFrame, name: str = "pandas"):
+    """Crea el backend ``name`` para ``df`` (pandas si Polars no está disponible)."""
+    if name == "polars":
+        if pl is not None:
+            return PolarsBackend(df)
+        logger.warning("Polars no está instalado; se usa el backend pandas")
+    return PandasBackend(df)
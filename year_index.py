@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Almacenamiento ordenado por fecha y tabla de desplazamientos por año.
+
+Los datasets se ordenan por fecha de transacción al cargarlos. Así las filas
+de cada año quedan contiguas y un rango de años es un corte ``iloc`` cuyos
+límites se obtienen con búsqueda binaria, sin recorrer la columna ``year``.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def sort_by_date(df: pd.DataFrame, date_column: str = "transactiondate_isodate") -> pd.DataFrame:
+    """Ordena ``df`` por fecha (orden estable, fechas faltantes al final)."""
+    out = df.sort_values(date_column, kind="stable", na_position="last")
+    return out.reset_index(drop=True)
+
+
+class YearOffsets:
+    """Primera fila de cada año en una columna ``year`` ordenada.
+
+    Las filas sin año (al final del frame ordenado) nunca entran en un
+    rango.
+    """
+
+    def __init__(self, years: pd.Series):
+        dated = years.dropna().to_numpy(dtype=np.int64)
+        if len(dated) and (np.diff(dated) < 0).any():
+            raise ValueError("La columna de años no está ordenada")
+        self.years, self.starts = np.unique(dated, return_index=True)
+        self.stop = len(dated)
+
+    def _offset(self, i: int) -> int:
+        return int(self.starts[i]) if i < len(self.years) else self.stop
+
+    def slice(self, low: int, high: int) -> slice:
+        """Corte de filas con ``low <= year <= high``."""
+        start = np.searchsorted(self.years, low, side="left")
+        stop = np.searchsorted(self.years, high, side="right")
+        if stop <= start:
+            return slice(0, 0)
+        return slice(self._offset(start), self._offset(stop))